@@ -4,10 +4,11 @@
 #
 # A shell-interface for a calculator
 
-import math, re, readline
+import math, sys, os, types, operator, functools, atexit
+from collections import OrderedDict, Counter
+from itertools import repeat
+from array import array
 
-TOKENIZATION_REGEX = r"(([0-9|.]+)|([A-Za-z|_|@][A-Za-z|_|0-9|@]*)|([\-|!|\+|\*|\||\/|&|=|<|>|!]){1,2}|([\(|\)|\^|%|,]))"
-VALUE_REGEX = r"[0-9|.]{1,}|[A-z|_|@][A-z|_|0-9|@]*"
 
 
 
@@ -51,48 +52,168 @@ OPERATORS = [
     
     #Assignment Operators
     ("=", 2, 0, 0),
+    (":=", 2, 0, 0), #Binds a formula
     ("+=", 2, 0, 0),
     ("-=" , 2, 0, 0),
     ("*=" , 2, 0, 0),
     ("/=" , 2, 0, 0)
 ]
 
-def get_matching_op(string, operand_count = None, position = None, precedence = None):
-    """With the given operator properties, returns the operator that matches.
-        If there are multiple matching operators, returns a list."""
+def build_operator_tables(operators):
+    """Builds the lookup tables used to resolve operators in O(1) time.
+        Returns the (symbol, position) index, the ops grouped by symbol,
+        and the set of symbols valid in each position"""
+    index = {}
+    by_symbol = {}
+    positions = {-1: set(), 0: set(), 1: set()}
 
-    matching_ops = []
-
-    for operator in OPERATORS:
+    for operator in operators:
         op_string, op_count, op_pos, op_precedence = operator
-        matches = True
-        
-        if string != op_string: matches = False
-        if operand_count is not None and operand_count != op_count: matches = False
-        if position is not None and position != op_pos: matches = False
-        if precedence is not None and precedence != op_precedence: matches = False
-
-        if matches: matching_ops.append(operator)
-
-    if len(matching_ops) == 1:
-        return matching_ops[0]
-    else:
-        return matching_ops
-
-def get_multichar_ops():
-    """Returns a list of all of the valid multichar ops"""
-    ops = []
-    for op, n, p, r in OPERATORS:
-        if len(op) == 2:
-            ops.append(op)
-    return ops
-
+        index[(op_string, op_pos)] = operator
+        by_symbol[op_string] = by_symbol.get(op_string, ()) + (operator,)
+        positions[op_pos].add(op_string)
+
+    positions = {pos : frozenset(symbols) for pos, symbols in positions.items()}
+    return types.MappingProxyType(index), types.MappingProxyType(by_symbol), types.MappingProxyType(positions)
+
+OPERATOR_INDEX, OPERATORS_BY_SYMBOL, OPERATOR_POSITIONS = build_operator_tables(OPERATORS)
+OPERATOR_SYMBOLS = frozenset(OPERATORS_BY_SYMBOL)
+PUNCTUATION = frozenset(["(", ")", ","])
+
+#Matches one token, and the whitespace before it, per match. The name of the group that matched is the kind of the token.
+#Operators are tried longest first so that multichar operators win over their first character.
+#It is compiled by the first call to tokenize so that importing re doesn't slow down starting the calculator.
+token_regex = None
+
+def get_token_regex():
+    global token_regex
+    if token_regex is None:
+        import re
+        token_regex = re.compile(r"\s*(?:" + "|".join([
+            r"(?P<float>[0-9]*\.[0-9]+)",
+            r"(?P<int>[0-9]+)",
+            r"(?P<name>[A-Za-z_@][A-Za-z_0-9@]*)",
+            "(?P<operator>" + "|".join(re.escape(op) for op in sorted(OPERATOR_SYMBOLS - PUNCTUATION, key=len, reverse=True)) + ")",
+            r"(?P<punctuation>[(),])",
+            r"(?P<unknown>\S)",
+        ]) + ")")
+    return token_regex
+
+#When true, factorials, permutations and combinations are estimated from log-gamma
+#   instead of being computed exactly, which is instant even for huge arguments
+approximate_combinatorics = False
+
+#Budgets for a single line. Exact results estimated to need more than max_digits digits, and arrays estimated to need
+#   more than memory_limit bytes, are refused before any work starts. time_limit is enforced while the line runs
+#   by evaluate_limited. None turns a budget off.
+max_digits = 10**6
+memory_limit = 2**30
+time_limit = None
+TIME_LIMIT = 10 #The default time_limit, in seconds, of the interactive prompt and the server
+
+def check_digits(digits, description, advice=""):
+    """Refuses an exact result estimated to have more than max_digits digits"""
+    if max_digits is not None and digits > max_digits:
+        raise LimitExceeded(f"Error: {description} would have about {digits:,.0f} digits, more than the limit of {max_digits:,}.{advice}")
+
+def check_memory(size, description):
+    """Refuses a result estimated to take more than memory_limit bytes"""
+    if memory_limit is not None and size > memory_limit:
+        raise LimitExceeded(f"Error: {description} would take about {size / 2**20:,.0f} MB, more than the limit of {memory_limit / 2**20:,.0f} MB.")
+
+APPROXIMATE_ADVICE = " Run with --approximate to estimate it instead."
+
+def log10_factorial(n):
+    return math.lgamma(n + 1) / math.log(10)
+
+@functools.lru_cache(maxsize=64)
+def exact_factorial(n):
+    """A memoized factorial, since large factorials are slow to recompute"""
+    return math.factorial(n)
+
+def approximate_exp(log_value):
+    """Returns e**log_value as a float, or as a 10 digit LargeNumber if it is too large for a float"""
+    if log_value < 709:
+        return math.exp(log_value)
+
+    LargeNumber = get_large_number_type()
+    context = LargeNumber.context
+    exponent = log_value / math.log(10)
+    whole = math.floor(exponent)
+    return LargeNumber(context.multiply(LargeNumber.convert(10 ** (exponent - whole)), context.power(10, whole)))
+
+@functools.lru_cache(maxsize=None)
+def get_large_number_type():
+    """Returns LargeNumber, which is made the first time it is needed since it imports decimal"""
+    import decimal, numbers
+
+    class LargeNumber(decimal.Decimal):
+        """A Decimal for approximations too large for a float. Arithmetic with floats, integers and fractions
+            is computed in its own unbounded context, and the result is a number of the backend again once it fits in a float."""
+        context = decimal.Context(prec=10, Emax=decimal.MAX_EMAX)
+
+        @staticmethod
+        def convert(value):
+            if isinstance(value, decimal.Decimal):
+                return value
+            if type(value) == float:
+                return decimal.Decimal(repr(value))
+            if isinstance(value, numbers.Rational):
+                return LargeNumber.context.divide(value.numerator, value.denominator)
+            return None
+
+        @staticmethod
+        def result(value):
+            if value.is_finite() and (value.is_zero() or -300 < value.adjusted() < 300):
+                return numeric_backend.convert(float(value))
+            return LargeNumber(value)
+
+    def operation(name, reflected):
+        def method(self, other):
+            other = LargeNumber.convert(other)
+            if other is None:
+                return NotImplemented
+            compute = getattr(LargeNumber.context, name)
+            return LargeNumber.result(compute(other, self) if reflected else compute(self, other))
+        return method
+
+    for names, context_name in [(("__add__", "__radd__"), "add"), (("__sub__", "__rsub__"), "subtract"),
+                                (("__mul__", "__rmul__"), "multiply"), (("__truediv__", "__rtruediv__"), "divide"),
+                                (("__pow__", "__rpow__"), "power")]:
+        setattr(LargeNumber, names[0], operation(context_name, False))
+        setattr(LargeNumber, names[1], operation(context_name, True))
+    LargeNumber.__neg__ = lambda self: LargeNumber(LargeNumber.context.minus(self))
+    LargeNumber.__abs__ = lambda self: LargeNumber(LargeNumber.context.abs(self))
+    return LargeNumber
+
+def factorial(n):
+    if int(n) != n:
+        raise CalculatorError("Error: Factorial only supports integer operands.")
+    if approximate_combinatorics:
+        return approximate_exp(math.lgamma(int(n) + 1))
+    if n > 1000:
+        check_digits(log10_factorial(n), f"{n}!", APPROXIMATE_ADVICE)
+    return exact_factorial(int(n))
 
 def Perm(n, r):
-    return math.factorial(n) // (math.factorial(n-r))
+    """The number of ordered selections of r of n items, as the product of the range n-r+1 to n"""
+    if approximate_combinatorics:
+        if not 0 <= r <= n:
+            return math.perm(n, r)
+        return approximate_exp(math.lgamma(n + 1) - math.lgamma(n - r + 1))
+    if 1000 < r <= n:
+        check_digits(log10_factorial(n) - log10_factorial(n - r), f"perm({n}, {r})", APPROXIMATE_ADVICE)
+    return math.perm(n, r)
     
 def Chose(n, r):
-    return math.factorial(n) // (math.factorial(n-r) * math.factorial(r))
+    """The number of unordered selections of r of n items, computed multiplicatively from the smaller of r and n-r"""
+    if approximate_combinatorics:
+        if not 0 <= r <= n:
+            return math.comb(n, r)
+        return approximate_exp(math.lgamma(n + 1) - math.lgamma(r + 1) - math.lgamma(n - r + 1))
+    if 1000 < min(r, n - r):
+        check_digits(log10_factorial(n) - log10_factorial(r) - log10_factorial(n - r), f"chose({n}, {r})", APPROXIMATE_ADVICE)
+    return math.comb(n, r)
 
 def dot2(ax, ay, bx, by):
     return ax*bx + ay*by
@@ -103,19 +224,448 @@ def dot3(ax, ay, az, bx, by, bz):
 def mag(x, y, z):
     return math.sqrt(x**2 + y**2 + z**2)
 
-def vecangle(ax, ay, az, bx, by, bz):
-    return math.acos( (dot3(ax, ay, az, bx, by, bz)) / (mag(ax, ay, az) * mag(bx, by, bz)) )
+def pack(values):
+    """Stores numbers in an array of machine integers or floats if that loses nothing,
+        and otherwise in a tuple, so that exact numbers like decimals and fractions stay exact"""
+    values = list(values)
+    kinds = set(map(type, values))
+    try:
+        if kinds <= {int}:
+            return array("q", values)
+        if kinds <= {int, float}:
+            return array("d", values)
+    except OverflowError:
+        pass
+    return tuple(values)
+
+NUMPY_SIZE = 10**5 #Components or multiply-adds above which float array operations are handed to NumPy, if it is installed
+
+#Operations whose results are floats whenever an operand is, so they can be written straight into a float array
+FLOAT_CLOSED = frozenset([operator.add, operator.sub, operator.mul, operator.truediv])
+SCALAR_TYPECODES = {int : "q", float : "d"}
+
+def combine(values, other, function):
+    """Applies a binary function to the components of values and other, which is either
+        a sequence of the same length or a single number, and returns the packed results"""
+    if hasattr(other, "__len__"):
+        if len(other) != len(values):
+            raise CalculatorError(f"Error: Values of lengths {len(values)} and {len(other)} can't be combined.")
+        results = map(function, values, other)
+    else:
+        results = map(function, values, repeat(other))
+
+    typecodes = {getattr(values, "typecode", None), other.typecode if type(other) == array else SCALAR_TYPECODES.get(type(other))}
+    if function in FLOAT_CLOSED and "d" in typecodes and typecodes <= {"d", "q"}:
+        result = numpy_operation(function, values, other) if len(values) >= NUMPY_SIZE else None
+        if result is not None:
+            return result
+        return array("d", results)
+    return pack(results)
 
-def cross(ax, ay, az, 
-          bx, by, bz):
+def format_components(values):
+    """Returns the components of a vector separated by commas, leaving out the middle of very long vectors"""
+    if len(values) > 1000:
+        return ", ".join([str(value) for value in values[:3]] + ["..."] + [str(value) for value in values[-3:]])
+    return ", ".join(map(str, values))
 
-        print("<", end="")
-        print(ay*bz-az*by, az*bx-ax*bz, ax*by-ay*bx, sep="," , end=">\nmag: ")
-    
-        return mag(ay*bz-az*by, az*bx-ax*bz, ax*by-ay*bx)
+class Vector():
+    """A vector value. Its components are stored compactly in an array when they are machine integers or floats.
+        Arithmetic operators work elementwise, or on every component with a number."""
+    __slots__ = ("values",)
+
+    def __init__(self, values):
+        self.values = values if type(values) in (array, tuple) else pack(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def operate(self, other, function, reflected=False):
+        if type(other) == Matrix:
+            return NotImplemented
+        if reflected and function not in (operator.add, operator.mul):
+            return Vector(pack(map(function, repeat(other), self.values)))
+        return Vector(combine(self.values, other.values if type(other) == Vector else other, function))
+
+    def __add__(self, other):
+        return self.operate(other, operator.add)
+
+    def __radd__(self, other):
+        return self.operate(other, operator.add, True)
+
+    def __sub__(self, other):
+        return self.operate(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self.operate(other, operator.sub, True)
+
+    def __mul__(self, other):
+        return self.operate(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self.operate(other, operator.mul, True)
+
+    def __truediv__(self, other):
+        return self.operate(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return self.operate(other, operator.truediv, True)
+
+    def __floordiv__(self, other):
+        return self.operate(other, operator.floordiv)
+
+    def __mod__(self, other):
+        return self.operate(other, operator.mod)
+
+    def __pow__(self, other):
+        return self.operate(other, operator.pow)
+
+    def __neg__(self):
+        return Vector(pack(map(operator.neg, self.values)))
+
+    def __abs__(self):
+        return Vector(pack(map(abs, self.values)))
+
+    def __eq__(self, other):
+        return type(other) == Vector and len(other) == len(self) and all(map(operator.eq, self.values, other.values))
+
+    def __hash__(self):
+        return hash(tuple(self.values))
+
+    def __str__(self):
+        return f"<{format_components(self.values)}>"
+
+class Matrix():
+    """A matrix value, with its components stored row by row like a Vector's.
+        * is the matrix product with another matrix or a vector, and every other operator works elementwise."""
+    __slots__ = ("rows", "columns", "values")
+
+    def __init__(self, rows, columns, values):
+        self.rows = rows
+        self.columns = columns
+        self.values = values if type(values) in (array, tuple) else pack(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def row(self, index):
+        return self.values[index * self.columns:(index + 1) * self.columns]
+
+    def operate(self, other, function, reflected=False):
+        if type(other) == Vector:
+            return NotImplemented
+        if type(other) == Matrix:
+            if (other.rows, other.columns) != (self.rows, self.columns):
+                raise CalculatorError(f"Error: A {self.rows}x{self.columns} and a {other.rows}x{other.columns} matrix can't be combined.")
+            other = other.values
+        if reflected and function not in (operator.add, operator.mul):
+            return Matrix(self.rows, self.columns, pack(map(function, repeat(other), self.values)))
+        return Matrix(self.rows, self.columns, combine(self.values, other, function))
+
+    def __add__(self, other):
+        return self.operate(other, operator.add)
+
+    def __radd__(self, other):
+        return self.operate(other, operator.add, True)
+
+    def __sub__(self, other):
+        return self.operate(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self.operate(other, operator.sub, True)
+
+    def __mul__(self, other):
+        if type(other) == Matrix:
+            return matrix_product(self, other)
+        if type(other) == Vector:
+            if len(other) != self.columns:
+                raise CalculatorError(f"Error: A {self.rows}x{self.columns} matrix can't multiply a vector of length {len(other)}.")
+            return Vector(pack(sum(map(operator.mul, self.row(i), other.values)) for i in range(self.rows)))
+        return self.operate(other, operator.mul)
+
+    def __rmul__(self, other):
+        if type(other) == Vector:
+            if len(other) != self.rows:
+                raise CalculatorError(f"Error: A vector of length {len(other)} can't multiply a {self.rows}x{self.columns} matrix.")
+            return Vector(pack(sum(map(operator.mul, other.values, self.values[j::self.columns])) for j in range(self.columns)))
+        return self.operate(other, operator.mul, True)
+
+    def __truediv__(self, other):
+        return self.operate(other, operator.truediv)
+
+    def __pow__(self, other):
+        """Integer powers of square matrices, by repeated squaring"""
+        power = int(other) if hasattr(other, "__int__") else 0
+        if self.rows != self.columns or power != other or power < 1:
+            raise CalculatorError("Error: Only square matrices can be raised to a power, and only to a positive integer.")
+        other = power
+        result = None
+        square = self
+        while other:
+            if other & 1:
+                result = square if result is None else matrix_product(result, square)
+            other >>= 1
+            if other:
+                square = matrix_product(square, square)
+        return result
+
+    def __neg__(self):
+        return Matrix(self.rows, self.columns, pack(map(operator.neg, self.values)))
+
+    def __abs__(self):
+        return Matrix(self.rows, self.columns, pack(map(abs, self.values)))
+
+    def __eq__(self, other):
+        return (type(other) == Matrix and (other.rows, other.columns) == (self.rows, self.columns)
+                and all(map(operator.eq, self.values, other.values)))
+
+    def __hash__(self):
+        return hash((self.rows, self.columns, tuple(self.values)))
+
+    def __str__(self):
+        rows = [f"<{format_components(self.row(i))}>" for i in range(min(self.rows, 1000))]
+        if self.rows > 1000:
+            rows[3:-3] = ["..."]
+        return f"[{', '.join(rows)}]"
+
+
+def numpy_views(*arrays):
+    """Returns NumPy arrays over the buffers of float arrays, without copying them,
+        or None if NumPy isn't installed or the values aren't all floats"""
+    if any(type(values) != array or values.typecode != "d" for values in arrays):
+        return None
+    try:
+        numpy = get_numpy()
+    except CalculatorError:
+        return None
+    return [numpy.frombuffer(values, dtype=float) for values in arrays]
+
+def numpy_operation(function, values, other):
+    """Applies an arithmetic operator to a float array and another float array or a number with NumPy,
+        or returns None if it can't"""
+    operands = numpy_views(values, other) if type(other) == array else numpy_views(values)
+    if operands is None:
+        return None
+    if type(other) != array:
+        operands.append(other)
+    with get_numpy().errstate(divide="raise"):
+        return array("d", function(*operands).tobytes())
+
+def matrix_product(a, b):
+    """Multiplies two matrices a row at a time, taking each column of b once"""
+    if a.columns != b.rows:
+        raise CalculatorError(f"Error: A {a.rows}x{a.columns} matrix can't multiply a {b.rows}x{b.columns} matrix.")
+    views = numpy_views(a.values, b.values) if a.rows * a.columns * b.columns >= NUMPY_SIZE else None
+    if views is not None:
+        product = views[0].reshape(a.rows, a.columns) @ views[1].reshape(b.rows, b.columns)
+        return Matrix(a.rows, b.columns, array("d", product.tobytes()))
+
+    columns = [b.values[j::b.columns] for j in range(b.columns)]
+    values = []
+    for i in range(a.rows):
+        row = a.row(i)
+        values.extend(sum(map(operator.mul, row, column)) for column in columns)
+    return Matrix(a.rows, b.columns, pack(values))
+
+def vec(*arguments):
+    """A vector of the arguments. Arrays and vectors among them are joined in."""
+    return Vector(pack(iterate_values(arguments)))
+
+def matrix(*rows):
+    """A matrix with the given vectors as its rows"""
+    if not rows or any(type(row) != Vector for row in rows):
+        raise CalculatorError("Error: matrix takes its rows as vectors.")
+    columns = len(rows[0])
+    if any(len(row) != columns for row in rows):
+        raise CalculatorError("Error: The rows of a matrix must all have the same length.")
+    return Matrix(len(rows), columns, pack(iterate_values(rows)))
+
+def transpose(value):
+    if type(value) == Vector:
+        return Matrix(len(value), 1, value.values)
+    if type(value) != Matrix:
+        raise CalculatorError("Error: transpose takes a matrix.")
+    return Matrix(value.columns, value.rows, pack(iterate_values(value.values[j::value.columns] for j in range(value.columns))))
+
+def vector_arguments(name, arguments):
+    """Returns the two vectors a function was called with, either as vectors or as six components"""
+    if len(arguments) == 2 and type(arguments[0]) == Vector and type(arguments[1]) == Vector:
+        return arguments
+    if len(arguments) == 6 and not any(type(argument) in (Vector, Matrix) for argument in arguments):
+        return Vector(arguments[:3]), Vector(arguments[3:])
+    raise CalculatorError(f"Error: {name} takes two vectors or six numbers.")
+
+def dot(a, b):
+    if type(a) != Vector or type(b) != Vector:
+        raise CalculatorError("Error: dot takes two vectors.")
+    if len(a) != len(b):
+        raise CalculatorError(f"Error: Vectors of lengths {len(a)} and {len(b)} don't have a dot product.")
+    views = numpy_views(a.values, b.values) if len(a) >= NUMPY_SIZE else None
+    if views is not None:
+        return float(views[0] @ views[1])
+    return sum(map(operator.mul, a.values, b.values))
+
+def vecangle(*arguments):
+    a, b = vector_arguments("vecangle", arguments)
+    return math.acos(dot(a, b) / (hypot(a) * hypot(b)))
+
+def cross(*arguments):
+    a, b = vector_arguments("cross", arguments)
+    if len(a) != 3 or len(b) != 3:
+        raise CalculatorError("Error: cross takes vectors of length 3.")
+    (ax, ay, az), (bx, by, bz) = a.values, b.values
+    return Vector(pack([ay*bz - az*by, az*bx - ax*bz, ax*by - ay*bx]))
+
+#The struct formats of buffers whose items memoryview can yield as numbers
+NUMERIC_BUFFER_FORMATS = frozenset("bBhHiIlLqQnNefd")
+
+def iterate_values(arguments):
+    """Yields the numbers in the arguments of a variadic function.
+        Arrays and columns are iterated where they are instead of being copied."""
+    for argument in arguments:
+        if not hasattr(argument, "__iter__"):
+            yield argument
+            continue
+        if type(argument) in (Vector, Matrix):
+            argument = argument.values
+        #A memoryview yields plain Python numbers from an array's buffer, which is much faster than NumPy's scalars.
+        #   It can't iterate object arrays, such as the results of factorials, so those are iterated directly.
+        try:
+            values = memoryview(argument)
+            if values.ndim != 1 or values.format.lstrip("@=<>!") not in NUMERIC_BUFFER_FORMATS:
+                values = argument
+        except TypeError:
+            values = argument
+        yield from values
+
+def square_root(value):
+    """Square root that keeps the precision of decimals"""
+    if hasattr(value, "sqrt"):
+        return value.sqrt()
+    return math.sqrt(value)
+
+def compensated_sum(values):
+    """Returns the count and sum of the values with Neumaier's compensated summation,
+        so rounding errors don't build up over many values"""
+    count = 0
+    result = 0
+    compensation = 0
+    for value in values:
+        count += 1
+        partial = result + value
+        if abs(result) >= abs(value):
+            compensation += (result - partial) + value
+        else:
+            compensation += (value - partial) + result
+        result = partial
+    return count, result + compensation
+
+def total(*arguments):
+    """The compensated sum of the values"""
+    return compensated_sum(iterate_values(arguments))[1]
+
+def welford(name, arguments, minimum_count):
+    """Returns the count, mean and sum of squared deviations of the values in a single pass with Welford's algorithm"""
+    count = 0
+    average = 0
+    squares = 0
+    for value in iterate_values(arguments):
+        count += 1
+        delta = value - average
+        average += delta / count
+        squares += delta * (value - average)
+    if count < minimum_count:
+        raise CalculatorError(f"Error: {name} needs at least {minimum_count} values.")
+    return count, average, squares
+
+def mean(*arguments):
+    """The mean, from a compensated sum and a count taken in the same pass"""
+    count, result = compensated_sum(iterate_values(arguments))
+    if count == 0:
+        raise CalculatorError("Error: mean needs at least one value.")
+    return result / count
+
+def variance(*arguments):
+    """The sample variance"""
+    count, average, squares = welford("var", arguments, 2)
+    return squares / (count - 1)
+
+def stdev(*arguments):
+    """The sample standard deviation"""
+    return square_root(variance(*arguments))
+
+def extreme(name, choose):
+    """Makes min or max, which compare the values as they stream past"""
+    def function(*arguments):
+        result = choose(iterate_values(arguments), default=None)
+        if result is None:
+            raise CalculatorError(f"Error: {name} needs at least one value.")
+        return result
+    function.__name__ = name
+    return function
+
+def median(*arguments):
+    """The middle value, or the mean of the two middle values. Unlike the others it has to sort a copy of the values."""
+    values = sorted(iterate_values(arguments))
+    if not values:
+        raise CalculatorError("Error: median needs at least one value.")
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+def hypot(*arguments):
+    """The square root of the sum of squares, in one pass that rescales as it goes so that nothing overflows"""
+    scale = 0
+    squares = 1
+    for value in iterate_values(arguments):
+        value = abs(value)
+        if value > scale:
+            squares = 1 + squares * (scale / value) ** 2
+            scale = value
+        elif value != 0:
+            squares += (value / scale) ** 2
+    return scale * square_root(squares) if scale else scale
+
+numpy = None
+
+def get_numpy():
+    """Imports NumPy the first time it is needed, since it is optional and slow to import"""
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise CalculatorError("Error: NumPy is required to use arrays.")
+    return numpy
+
+def linspace(start, stop, count):
+    check_memory(8 * count, f"An array of {count:,.0f} values")
+    return get_numpy().linspace(start, stop, int(count))
+
+def arange(start, stop, step):
+    if step != 0:
+        check_memory(8 * (stop - start) / step, f"An array of {(stop - start) / step:,.0f} values")
+    return get_numpy().arange(start, stop, step)
+
+def power(base, exponent):
+    """base ^ exponent, refusing exact integer and fraction powers too large to compute"""
+    if hasattr(base, "denominator") and hasattr(exponent, "denominator") and exponent.denominator == 1:
+        size = max(abs(base.numerator), base.denominator)
+        if size > 1 and (exponent > 0 or type(base) != int):
+            base_digits = math.log10(size)
+            #Long bases are described by their length, since converting them to text is slow or refused
+            description = f"{base}^{exponent}" if base_digits < 50 else f"a {math.floor(base_digits) + 1:,} digit number ^ {exponent}"
+            check_digits(abs(exponent) * base_digits, description)
+    return base ** exponent
 
 #The dictionary stores a tuple with the numver of arguments a function has
-#   and the function that it calls
+#   and the function that it calls. None means it takes any number of arguments.
 FUNCTIONS = {
     "exit" : (0, exit),
 
@@ -146,282 +696,207 @@ FUNCTIONS = {
     "dot2" : (4, dot2),
     "dot3" : (6, dot3),
     "mag" : (3, mag),
-    "vecangle" : (6, vecangle),
-    "cross" : (6, cross)
+    "vecangle" : (None, vecangle),
+    "cross" : (None, cross),
+
+    "vec" : (None, vec), #vectors and matrices
+    "matrix" : (None, matrix),
+    "dot" : (2, dot),
+    "transpose" : (1, transpose),
+
+    "linspace" : (3, linspace), #arrays
+    "arange" : (3, arange),
+
+    "sum" : (None, total), #statistics, which take any number of arguments
+    "mean" : (None, mean),
+    "var" : (None, variance),
+    "stdev" : (None, stdev),
+    "min" : (None, extreme("min", min)),
+    "max" : (None, extreme("max", max)),
+    "median" : (None, median),
+    "hypot" : (None, hypot),
 }
 
+#Functions that have side effects or return new mutable objects, so calls to them are never constant folded
+IMPURE_FUNCTIONS = frozenset(["exit", "linspace", "arange"])
+
 
 
 
 
 def tokenize(line: str):
-    """Splits the input string into tokens with a REGEX and maintains the order"""
+    """Splits the input string into typed tokens in a single pass and maintains the order.
+        Number literals become ints or floats, while names, operators and punctuation stay strings.
+        If the line contains a character that can't begin any token, an error string is returned."""
 
-    matches = re.findall(TOKENIZATION_REGEX, line)
-    tokens = [ match[0] for match in matches]
-    
-   
-    #If any grouped pair of operators can't form a multichar operator, break them up
-    all_ops = [op for op, n, p, r in OPERATORS]
-    multichar_ops = get_multichar_ops()
-    
-    fixed_tokens = [] 
-    for token in tokens:
-        if len(token) == 2 and token[0] in all_ops and not (token in multichar_ops):
-            fixed_tokens.append(token[0])
-            fixed_tokens.append(token[1])
+    tokens = []
+    for match in get_token_regex().finditer(line):
+        kind = match.lastgroup
+        if kind == "int":
+            try:
+                tokens.append(int(match.group(kind)))
+            except ValueError: #Python refuses to convert integers of more than a few thousand digits from text
+                return f"Error: The number {match.group(kind)[:10]}... has too many digits ({len(match.group(kind))}) to be read."
+        elif kind == "float":
+            tokens.append(float(match.group(kind)))
+        elif kind == "unknown":
+            return f"Error: \"{match.group(kind)}\" is not a recognized symbol."
         else:
-            fixed_tokens.append(token)
-
-    return fixed_tokens
-
-class ParseNode():
-    def __init__(self, var, body, terminal_list, parent=None):
-        self.var = var
-        self.body = body
-        self.children = []
-        self.parent = parent
-        self.terminal_list = terminal_list
-    
-    def __str__(self):
-        return "{" + str(self.var) + "," +  str(self.body) + "}"
-
-    def parse(self):
-        """Parses the body of the parser"""
-
-        if self.body == []:
-            if not self.is_nullable():
-                return "Error: Unexpected end of expression."
-            else:
-                return 0
-
-        if self.is_terminal():
-            if ParseNode.check_terminal(self.var, self.body[0]):
-
-                self.body = self.body[0]
-                
-                self.terminal_list.append(self)
-
-                return 1
-            else:
-                return f"Error: {self.body[0]} is not a valid terminal."
-
-        
-        body_len = 0
-        remaining_body = self.body[:]
-        
-        #Find what this var subsitutes out to given the first token in its body
-        children_vars = ParseNode.find_sub(self.var, self.body[0])
-        
-        #Return if there is an error
-        if type(children_vars) == str:
-            return children_vars
-
-        #Parse each child var recursively and find how much of the body that makes uo
-        #Pass the remaining body onto the next one.
-
-        for child_var in children_vars:
-            new_parser = ParseNode(child_var, remaining_body, self.terminal_list, self)
-            
-            parse_result = new_parser.parse()
-
-
-            #Return if there is an error
-            if type(parse_result) == str:
-                return parse_result
-
-            body_len += parse_result
-            
-            remaining_body = self.body[body_len:]
-            
-            self.children.append(new_parser)
-
-        #The current body is only the parts of the body used by the children
-        self.body = self.body[:body_len]
-
-        return len(self.body)
-
-    def is_terminal(self):
-        return self.var in ["Pr", "In", "Po", "V", "Op", "Cp", "Cm"]
-
-    def is_nullable(self):
-        return self.var in ["Re", "Fb", "Fa"]
-
-    @staticmethod
-    def find_sub(var, token):
-        """A lookup table that returns what the substitution will be for any given var with a first token of token"""
-
-        if var == "Mn":
-            if token == "(":
-                return ["Ex"]
-            elif ParseNode.check_op_pos(token, -1):
-                return ["Pr", "Ex"]
-            elif ParseNode.check_op_pos(token, 0):
-                return ["In", "Ex"]
-            else:
-                return ["Ex"]
-
-        if var == "Ex":
-            if token == "(":
-                return ["Op", "Ex", "Cp", "Re"]
-            
-            elif ParseNode.check_op_pos(token, -1):
-                return ["Pr", "Ex"]
-            elif ParseNode.check_if_value(token):
-                return ["V", "Re"]
-            else:
-                return f"Error: {token} cannot begin an expression"
-
-        elif var == "Re":
-            if token == "(":
-                return ["Fc", "Re"]
-            elif ParseNode.check_op_pos(token, 0):
-                return ["In", "Ex"]
-            elif ParseNode.check_op_pos(token, 1):
-                return ["Po", "Re"]
-            else:
-                return []
-
-        elif var == "Fc":
-            if token == "(":
-                return ["Op", "Fb", "Cp"]
-            else:
-                return f"Error: {token} cannot begin a function call"
-        
-        elif var == "Fb":
-            if token == "(" or ParseNode.check_op_pos(token, -1) or ParseNode.check_if_value(token):
-                return ["Ex", "Fa"]
-            elif token == ")":
-                return []
-            else:
-                return f"Error: {token} cannot begin a function body."
-
-        elif var == "Fr":
-            if token == "(" or ParseNode.check_op_pos(token, -1) or ParseNode.check_if_value(token):
-                return ["Ex", "Fa"]
-            else:
-                return f"Error: {token} cannot begin a function argument."
+            tokens.append(match.group(kind))
 
-        elif var == "Fa":
-            if token == ",":
-                return ["Cm", "Fr"]
-            else:
-                return []
-    
-    @staticmethod
-    def check_op_pos(op, pos):
-        """Check if the given operator can correspond to the given position
-        pos
-            pos = -1: prefix
-            pos = 0: infix
-            pos = 1: postfix"""
-        result = False
-
-        for operator in OPERATORS:
-            string, operands, position, precedence = operator
-            if op == string and position == pos:
-                result = True
-        return result
+    return tokens
 
-    @staticmethod
-    def check_if_value(token):
-        """Return true if the given token is a number or name"""
-        return re.fullmatch(VALUE_REGEX, token)
+#For each grammar variable, the ordered (token role, substitution) rules used to expand it
+#   and the substitution used when no rule matches. A string substitution is an error.
+GRAMMAR = {
+    "Mn" : ((("(", ("Ex",)), ("prefix", ("Pr", "Ex")), ("infix", ("In", "Ex"))),
+            ("Ex",)),
+    "Ex" : ((("(", ("Op", "Ex", "Cp", "Re")), ("prefix", ("Pr", "Ex")), ("value", ("V", "Re"))),
+            "Error: {token} cannot begin an expression"),
+    "Re" : ((("(", ("Fc", "Re")), ("infix", ("In", "Ex")), ("postfix", ("Po", "Re"))),
+            ()),
+    "Fc" : ((("(", ("Op", "Fb", "Cp")),),
+            "Error: {token} cannot begin a function call"),
+    "Fb" : ((("(", ("Ex", "Fa")), ("prefix", ("Ex", "Fa")), ("value", ("Ex", "Fa")), (")", ())),
+            "Error: {token} cannot begin a function body."),
+    "Fr" : ((("(", ("Ex", "Fa")), ("prefix", ("Ex", "Fa")), ("value", ("Ex", "Fa"))),
+            "Error: {token} cannot begin a function argument."),
+    "Fa" : (((",", ("Cm", "Fr")),),
+            ()),
+}
 
-    @staticmethod
-    def check_terminal(var, token):
-        """Returns true if the given var matches the given token"""
-        if var == "Pr":
-            return ParseNode.check_op_pos(token, -1)
-        elif var == "In":
-            return ParseNode.check_op_pos(token, 0)
-        elif var == "Po":
-            return ParseNode.check_op_pos(token, 1)  
-        elif var == "V":
-            return ParseNode.check_if_value(token)
-        elif var == "Op":
-            return token == "("
-        elif var == "Cp":
-            return token == ")"
-        elif var == "Cm":
-            return token == ","
-        else:
-            return False
+#The token role each terminal grammar variable matches
+TERMINALS = {
+    "Pr" : "prefix",
+    "In" : "infix",
+    "Po" : "postfix",
+    "V" : "value",
+    "Op" : "(",
+    "Cp" : ")",
+    "Cm" : ",",
+}
 
-    @staticmethod
-    def get_operand_position(var):
-        """Convert the name of a variable to the operator position it corresponds to"""
-        if var.var == "Pr":
-            return -1
-        if var.var == "In":
-            return 0
-        if var.var == "Po":
-            return 1
+NULLABLE = frozenset(["Re", "Fb", "Fa"])
+
+def check_op_pos(op, pos):
+    """Check if the given operator can correspond to the given position
+    pos
+        pos = -1: prefix
+        pos = 0: infix
+        pos = 1: postfix"""
+    return op in OPERATOR_POSITIONS[pos]
+
+def build_token_roles():
+    """Returns a table of the grammar roles each operator and punctuation token can fill"""
+    token_roles = {}
+    for token in OPERATOR_SYMBOLS | PUNCTUATION:
+        roles = set()
+        if token in PUNCTUATION:
+            roles.add(token)
+        if check_op_pos(token, -1):
+            roles.add("prefix")
+        if check_op_pos(token, 0):
+            roles.add("infix")
+        if check_op_pos(token, 1):
+            roles.add("postfix")
+        token_roles[token] = frozenset(roles)
+    return types.MappingProxyType(token_roles)
+
+TOKEN_ROLES = build_token_roles()
+VALUE_ROLES = frozenset(["value"])
+
+def get_token_roles(token):
+    """Returns the set of grammar roles the token can fill.
+        Any token that isn't an operator or punctuation is a number or a name."""
+    return TOKEN_ROLES.get(token, VALUE_ROLES)
+
+#The operator position of each terminal role that is an operator
+ROLE_POSITIONS = {
+    "prefix" : -1,
+    "infix" : 0,
+    "postfix" : 1,
+}
 
 def parse(tokens : list):
-    """Pareses a list of tokens into a parse tree"""
-    terminal_list = []
-    parser = ParseNode("Mn", tokens, terminal_list)
-    parse_result = parser.parse()
-
-    string = ""
-    if type(parse_result) == int and parse_result < len(tokens):
-        parse_result = f"Error: Unexpected symbols \"{ string.join([x for x in tokens[parse_result:] ])}\""
-
-    if type(parse_result) == str:
-        return parse_result
-    return terminal_list
-
-
-def replace_operators(terminal_vars: list):
-    """Replaces operators with their tuple representation and inserts function call operators"""
+    """Parses a list of tokens with the LL(1) table in GRAMMAR and returns the instruction stream for to_postfix:
+        the tokens in order, with every operator resolved to its tuple and the "(" of every function call replaced
+        by a call operator holding its argument count. Operators at the start of a line get @ as their first operand.
+        The parser is iterative, with an explicit stack of (variable, parent variable) pairs, and reads the tokens
+        by index. Nothing is kept of a token once it is emitted, except the position of the unfinished calls,
+        so it runs in linear time at any nesting depth and with any number of arguments."""
+    output = []
+    token_count = len(tokens)
+    position = 0
 
-    tokens = []
+    stack = [("Mn", None)]
+    call_starts = [] #Where the call operator of each function call being parsed goes in output
+    arg_counts = [] #And how many arguments it has so far
 
-    for terminal in terminal_vars:
-        
-        if terminal.var in ["Pr", "In", "Po"]:
-            
-            if terminal.parent.var == "Mn":
-                tokens.append("@")
-            
-            position = ParseNode.get_operand_position(terminal)
-            match = get_matching_op(terminal.body, position=position)
+    while stack:
+        var, parent = stack.pop()
 
-            if type(match) == list:
-                if len(match) == 0:
-                    return f"Error: Operator \"{terminal.body}\" cannot be in that position."
-                else:
-                    return f"Error: Not enough context to determine operator type of \"{terminal.body}\""
+        if position == token_count:
+            if var in NULLABLE:
+                continue
+            return "Error: Unexpected end of expression."
+
+        token = tokens[position]
+        roles = get_token_roles(token)
+
+        terminal_role = TERMINALS.get(var)
+        if terminal_role is not None:
+            if terminal_role not in roles:
+                return f"Error: {token} is not a valid terminal."
+            position += 1
+
+            operator_position = ROLE_POSITIONS.get(terminal_role)
+            if operator_position is not None:
+                if parent == "Mn":
+                    output.append("@")
+                output.append(OPERATOR_INDEX[(token, operator_position)])
+            elif parent == "Fc" and var == "Op":
+                call_starts.append(len(output))
+                arg_counts.append(0)
+                output.append(None) #Filled in once the arguments are counted
+            elif parent == "Fc" and var == "Cp":
+                output[call_starts.pop()] = ("(", arg_counts.pop(), 0, 7)
+                output.append(token)
             else:
-                tokens.append(match)
+                output.append(token)
+            continue
 
-        elif terminal.var == "Op":
-            if terminal.parent.var == "Fc":
+        rules, substitution = GRAMMAR[var]
+        for role, rule_substitution in rules:
+            if role in roles:
+                substitution = rule_substitution
+                break
 
-                #Check down the tree and count the number of arguments in the function call
-                arg_count = 0
-                current = terminal.parent.children[1]
-                if current.children != []:
-                    current = current.children[1]
-                    arg_count+=1
-                    while current.body != []:
-                        current = current.children[1].children[1]
-                        arg_count+=1
+        if type(substitution) == str:
+            return substitution.format(token=token)
 
-                string, n, p, r = get_matching_op("(")
-                function_call = (string, arg_count, p, r)
+        #Every expression in a function body or argument list is another argument
+        if (var == "Fb" or var == "Fa") and substitution:
+            arg_counts[-1] += 1
 
-                tokens.append(function_call)
+        for child_var in reversed(substitution):
+            stack.append((child_var, var))
 
-            else:
-                tokens.append("(")
-                
+    if position < token_count:
+        string = ""
+        return f"Error: Unexpected symbols \"{ string.join([str(x) for x in tokens[position:] ])}\""
 
-        elif len(terminal.body) > 0:
-            tokens.append(terminal.body)
-    
-    return tokens
+    return output
+
+def reads_last_answer(tokens):
+    """Returns whether a line implicitly starts with @, because its first token can only be an infix operator.
+        This is the rule the parser uses to expand Mn."""
+    if not tokens:
+        return False
+    roles = get_token_roles(tokens[0])
+    for role, substitution in GRAMMAR["Mn"][0]:
+        if role in roles:
+            return substitution[0] == "In"
+    return False
 
 def is_open_paren(token):
     """For the purposes of conversion to postfix,
@@ -481,177 +956,583 @@ def to_postfix(tokens):
     
     return output
 
-def execute_postfix(tokens, global_vars):
-    stack = []
-    for token in tokens:
+class Program():
+    """A compiled postfix program passed as an unevaluated argument to a special form"""
+    __slots__ = ("postfix",)
+
+    def __init__(self, postfix):
+        self.postfix = postfix
+
+    def __str__(self):
+        return "{" + " ".join(str(token) for token in self.postfix) + "}"
+
+def get_stack_effect(token):
+    """Returns the number of stack entries a postfix token pops, not counting what it pushes"""
+    if type(token) != tuple:
+        return 0
+    if token[0] == "(":
+        return token[1] + 1 #The arguments and the function name
+    return token[1]
+
+#Operators whose quoted operands are passed as unevaluated Programs, by the indices of the quoted operands
+QUOTING_OPERATORS = {
+    (":=", 2, 0, 0) : (1,),
+}
+
+def compile_special_forms(postfix):
+    """Replaces the quoted arguments of calls to special forms, and the quoted operands
+        of QUOTING_OPERATORS, with unevaluated Programs.
+        Every value on the simulated stack remembers where the code that produced it starts,
+        so the code for each argument can be sliced out in a single pass."""
+    output = []
+    starts = []
+
+    for token in postfix:
+        popped = get_stack_effect(token)
+        if popped > len(starts):
+            return postfix #Malformed, so leave the error for execution to report
+
+        start = starts[len(starts) - popped] if popped else len(output)
+        argument_starts = starts[len(starts) - popped:]
+        del starts[len(starts) - popped:]
+
+        if type(token) == tuple and token[0] == "(":
+            function_name = output[start]
+            special_form = SPECIAL_FORMS.get(function_name) if type(function_name) == str else None
+
+            if special_form is not None and special_form[0] == token[1]:
+                arg_count, quoted, function = special_form
+                #Quote the arguments from last to first so the earlier starts stay valid
+                argument_ends = argument_starts[2:] + [len(output)]
+                for index in reversed(quoted):
+                    arg_start, arg_end = argument_starts[index + 1], argument_ends[index]
+                    output[arg_start:arg_end] = [Program(output[arg_start:arg_end])]
+        elif token in QUOTING_OPERATORS:
+            operand_ends = argument_starts[1:] + [len(output)]
+            for index in reversed(QUOTING_OPERATORS[token]):
+                operand_start, operand_end = argument_starts[index], operand_ends[index]
+                output[operand_start:operand_end] = [Program(output[operand_start:operand_end])]
+
+        output.append(token)
+        starts.append(start)
+
+    return output
+
+def compile_definitions(postfix):
+    """Turns a function definition, f(x, y) = body, into a call to the define special form
+        with the name, parameters and body quoted, so that the body is compiled only once"""
+    if len(postfix) < 4 or postfix[-1] != ("=", 2, 0, 0) or type(postfix[0]) != str:
+        return postfix
+
+    #The call is the assignment's first operand if it is only made of names
+    parameter_count = 0
+    while type(postfix[parameter_count + 1]) == str:
+        parameter_count += 1
+    call_end = parameter_count + 2
+    if postfix[call_end - 1] != ("(", parameter_count, 0, 7):
+        return postfix
+
+    #And the rest up to the assignment is a single operand
+    depth = 0
+    for token in postfix[call_end:-1]:
+        depth -= get_stack_effect(token)
+        if depth < 0:
+            return postfix
+        depth += 1
+    if depth != 1:
+        return postfix
+
+    name, parameters, body = Program(postfix[:1]), Program(postfix[1:call_end - 1]), Program(postfix[call_end:-1])
+    return ["define", name, parameters, body, ("(", 3, 0, 7)]
+
+#Operators that assign to their variable operand, so they are never constant folded
+ASSIGNMENT_OPERATORS = frozenset([
+    ("--", 1, 1, 5),
+    ("++", 1, 1, 5),
+    ("=", 2, 0, 0),
+    (":=", 2, 0, 0),
+    ("+=", 2, 0, 0),
+    ("-=" , 2, 0, 0),
+    ("*=" , 2, 0, 0),
+    ("/=" , 2, 0, 0),
+])
+
+NOT_CONSTANT = object()
+
+def get_constant_value(token):
+    """Returns the value of a number or read-only constant operand, or NOT_CONSTANT"""
+    if type(token) in numeric_backend.number_types:
+        return token
+    if type(token) == str and token in CONSTANTS:
+        return numeric_backend.constants[token]
+    return NOT_CONSTANT
+
+def fold_operation(token, operands):
+    """Executes an operator or pure function call on constant operands at compile time.
+        Returns NOT_CONSTANT if it can't be folded, including when it would fail,
+        so that the error is still reported when the program is executed."""
+    try:
+        if token[0] == "(":
+            function_name, arguments = operands[0], operands[1:]
+            functions = numeric_backend.functions
+            if type(function_name) != str or function_name in IMPURE_FUNCTIONS or function_name not in functions:
+                return NOT_CONSTANT
+            expected_args, function = functions[function_name]
+            if expected_args is not None and expected_args != len(arguments):
+                return NOT_CONSTANT
+            result = function(*arguments)
+        else:
+            if token in ASSIGNMENT_OPERATORS:
+                return NOT_CONSTANT
+            stack = list(operands)
+            if OPERATIONS[token](stack, numeric_backend.constants):
+                return NOT_CONSTANT
+            result = stack[-1]
+    except Exception:
+        return NOT_CONSTANT
+
+    if type(result) in numeric_backend.number_types:
+        return result
+    return NOT_CONSTANT
+
+def fold_constants(postfix):
+    """Replaces every operator and pure function call whose operands are all numbers or
+        read-only constants with its result, so it isn't recomputed on every execution.
+        Lone constants are left as names so that they still display as variables."""
+    output = []
+    starts = []
+    values = []
+
+    for token in postfix:
+        popped = get_stack_effect(token)
+        if popped > len(starts):
+            return postfix #Malformed, so leave the error for execution to report
+
+        if type(token) == Program:
+            token = Program(fold_constants(token.postfix))
+
+        if popped == 0:
+            starts.append(len(output))
+            values.append(get_constant_value(token))
+            output.append(token)
+            continue
+
+        start = starts[len(starts) - popped]
+        operands = values[len(values) - popped:]
+        del starts[len(starts) - popped:]
+        del values[len(values) - popped:]
+
+        result = NOT_CONSTANT
+        #A function name is never a constant, so calls are checked by their arguments
+        checked = operands[1:] if token[0] == "(" else operands
+        if all(value is not NOT_CONSTANT for value in checked):
+            if token[0] == "(":
+                operands[0] = output[start]
+            result = fold_operation(token, operands)
+
+        if result is NOT_CONSTANT:
+            output.append(token)
+        else:
+            output[start:] = [result]
+
+        starts.append(start)
+        values.append(result)
+
+    return output
+
+class CalculatorError(Exception):
+    """Raised to abort execution. The message is the error string that is shown to the user."""
+
+class LimitExceeded(CalculatorError):
+    """Raised when a line would go, or has gone, over its time or memory budget"""
+
+def unary_operation(function):
+    """Wraps a one operand function into an operation on the execution stack"""
+    def operation(stack, global_vars):
+        op = get_value(stack.pop(), global_vars)
+        if type(op) == str:
+            return op
+        stack.append(function(op))
+    return operation
+
+def binary_operation(function):
+    """Wraps a two operand function into an operation on the execution stack"""
+    def operation(stack, global_vars):
+        op2 = get_value(stack.pop(), global_vars)
+        if type(op2) == str:
+            return op2
+        op1 = get_value(stack.pop(), global_vars)
+        if type(op1) == str:
+            return op1
+        stack.append(function(op1, op2))
+    return operation
+
+def unary_assignment(function):
+    """Wraps a one operand function into an operation that stores its result
+        back into the variable operand and evaluates to the variable name"""
+    def operation(stack, global_vars):
+        raw = stack.pop()
+        op = get_value(raw, global_vars)
+        if type(op) == str:
+            return op
+        error = set_variable(raw, function(op), global_vars)
+        if error:
+            return error
+        stack.append(raw)
+    return operation
+
+def binary_assignment(function):
+    """Wraps a two operand function into an operation that stores its result
+        into the first (variable) operand and evaluates to the variable name.
+        If function is None, the second operand is assigned as is."""
+    def operation(stack, global_vars):
+        op2 = get_value(stack.pop(), global_vars)
+        if type(op2) == str:
+            return op2
+        raw1 = stack.pop()
+        if function is None:
+            value = op2
+        else:
+            op1 = get_value(raw1, global_vars)
+            if type(op1) == str:
+                return op1
+            value = function(op1, op2)
+        error = set_variable(raw1, value, global_vars)
+        if error:
+            return error
+        stack.append(raw1)
+    return operation
+
+def bind_operation(stack, global_vars):
+    """Binds the variable operand to the quoted formula operand and evaluates to the variable name"""
+    program = stack.pop()
+    name = stack.pop()
+    error = bind_formula(name, program, global_vars)
+    if error:
+        return error
+    stack.append(name)
+
+def call_function(operand_count, stack, global_vars, functions=None):
+    """Pops a function name and its arguments off of the stack and pushes the result of the call.
+        functions defaults to the function table of the numeric backend."""
+    if functions is None:
+        functions = numeric_backend.functions
+
+    arguments = []
+    for raw_arg in stack[len(stack) - operand_count:]:
+        arg = get_value(raw_arg, global_vars)
+        if type(arg) == str:
+            return arg
+        arguments.append(arg)
+    del stack[len(stack) - operand_count:]
+
+    function_name = stack.pop()
+
+    special_form = SPECIAL_FORMS.get(function_name) if type(function_name) == str else None
+    if special_form is not None:
+        expected_args, quoted, function = special_form
+        if expected_args != operand_count:
+            return f"Error: The function, \"{function_name}\", expected {expected_args} arguments. {operand_count} were provided."
+        stack.append(function(global_vars, *arguments))
+        return
+
+    if function_name not in functions:
+        user_functions = getattr(global_vars, "functions", None)
+        if user_functions is None or function_name not in user_functions:
+            return f"Error: The function, \"{function_name}\", is not a known function name"
+        user_function = user_functions[function_name]
+        if len(user_function.parameters) != operand_count:
+            return f"Error: The function, \"{function_name}\", expected {len(user_function.parameters)} arguments. {operand_count} were provided."
+        stack.append(user_function(global_vars, arguments))
+        return
         
-        if type(token) == tuple:
-            result = 0
-            error = None
+    expected_args, function = functions[function_name]
+
+    if expected_args is not None and expected_args != operand_count:
+        return f"Error: The function, \"{function_name}\", expected {expected_args} arguments. {operand_count} were provided."
+    
+    stack.append(function(*arguments))
+
+#Maps every operator (other than function calls) to the operation that executes it
+OPERATIONS = types.MappingProxyType({
+    ("-", 1, -1, 6) : unary_operation(lambda op: -op),
+    ("!", 1, -1, 6) : unary_operation(lambda op: int(not op)),
+
+    ("!", 1, 1, 5) : unary_operation(factorial),
+    ("--", 1, 1, 5) : unary_assignment(lambda op: op - 1),
+    ("++", 1, 1, 5) : unary_assignment(lambda op: op + 1),
+
+    ("^", 2, 0, 4) : binary_operation(power),
+
+    ("*", 2, 0, 3) : binary_operation(lambda op1, op2: op1 * op2),
+    ("/", 2, 0, 3) : binary_operation(lambda op1, op2: op1 / op2),
+    ("//", 2, 0, 3) : binary_operation(lambda op1, op2: op1 // op2),
+    ("%", 2, 0, 3) : binary_operation(lambda op1, op2: op1 % op2),
+
+    ("+", 2, 0, 2) : binary_operation(lambda op1, op2: op1 + op2),
+    ("-", 2, 0, 2) : binary_operation(lambda op1, op2: op1 - op2),
+
+    ("&&", 2, 0, 2) : binary_operation(lambda op1, op2: int(op1 and op2)),
+    ("||", 2, 0, 2) : binary_operation(lambda op1, op2: int(op1 or op2)),
+
+    ("==", 2, 0, 1) : binary_operation(lambda op1, op2: int(op1 == op2)),
+    ("<=", 2, 0, 1) : binary_operation(lambda op1, op2: int(op1 <= op2)),
+    (">=", 2, 0, 1) : binary_operation(lambda op1, op2: int(op1 >= op2)),
+    ("!=", 2, 0, 1) : binary_operation(lambda op1, op2: int(op1 != op2)),
+    ("<", 2, 0, 1) : binary_operation(lambda op1, op2: int(op1 < op2)),
+    (">", 2, 0, 1) : binary_operation(lambda op1, op2: int(op1 > op2)),
+
+    ("=", 2, 0, 0) : binary_assignment(None),
+    (":=", 2, 0, 0) : bind_operation,
+    ("+=", 2, 0, 0) : binary_assignment(lambda op1, op2: op1 + op2),
+    ("-=", 2, 0, 0) : binary_assignment(lambda op1, op2: op1 - op2),
+    ("*=", 2, 0, 0) : binary_assignment(lambda op1, op2: op1 * op2),
+    ("/=", 2, 0, 0) : binary_assignment(lambda op1, op2: op1 / op2),
+})
+
+def execute_postfix(tokens, global_vars, operations=OPERATIONS, functions=None):
+    """Executes a postfix program and returns the value (or variable name) left on top of the stack.
+        Each operator is executed with a single lookup in operations.
+        functions defaults to the function table of the numeric backend.
+        If execution fails, the error string is returned instead."""
+    if functions is None:
+        functions = numeric_backend.functions
+    stack = []
+    try:
+        for token in tokens:
             
-            #FIND THE OPERATOR AND EXECUTE IT
-                        
-            string, operand_count, position, precedence = token
-
-            if string == "(":
-                arguments = []
-                for i in range(operand_count):
-                    raw_arg = stack[-1]
-                    del stack[-1]
-                    arg = get_value(raw_arg, global_vars)
-
-                    arguments.append(arg)
-                    
-                arguments.reverse()
-
-                function_name = stack[-1]
-                del stack[-1]
-
-                if function_name not in FUNCTIONS.keys():
-                    return f"Error: The function, \"{function_name}\", is not a known function name"
-                    
-                expected_args, function = FUNCTIONS[function_name]
-
-                if expected_args != operand_count:
-                    return f"Error: The function, \"{function_name}\", expected {expected_args} arguments. {operand_count} were provided."
-                
-                result = function(*arguments)
-
-            elif token == ("=", 2, 0, 0):
-                raw2 = stack[-1]
-                op2 = get_value(raw2, global_vars)
-                del stack[-1]
-                if type(op2) == str:
-                    return op2
-
-                raw1 = stack[-1]
-                del stack[-1]
-                
-                error = set_variable(raw1, op2, global_vars)
-
-                result = raw1
-
-            elif operand_count == 2:
-                raw2 = stack[-1]
-                op2 = get_value(raw2, global_vars)
-                del stack[-1]
-                if type(op2) == str:
-                    return op2
-
-                raw1 = stack[-1]
-                op1 = get_value(raw1, global_vars)
-                del stack[-1]
-                if type(op1) == str:
-                    return op1
-                
-                if token == ("^", 2, 0, 4):
-                    result = op1 ** op2
-                if token == ("*", 2, 0, 3):
-                    result = op1 * op2
-                elif token == ("/", 2, 0, 3):
-                    try:
-                        result = op1 / op2
-                    except ZeroDivisionError:
-                        return "Error: Cannot divide by zero, silly guy."
-
-                elif token == ("//", 2, 0, 3):
-                    try:
-                        result = op1 // op2
-                    except ZeroDivisionError:
-                        return "Error: Cannot divide by zero, silly guy."
-
-                elif token == ("%", 2, 0, 3):
-                    try:
-                        result = op1 % op2
-                    except ZeroDivisionError:
-                        return "Error: Cannot divide by zero, silly guy."
-
-                elif token == ("+", 2, 0, 2):
-                    result = op1 + op2
-                elif token == ("-", 2, 0, 2):
-                    result = op1 - op2
-                elif token == ("&&", 2, 0, 2):
-                    result = int(op1 and op2)
-                elif token == ("||", 2, 0, 2):
-                    result = int(op1 or op2)
-                elif token == ("==", 2, 0, 1):
-                    result = int(op1 == op2)
-                elif token == ("<=", 2, 0, 1):
-                    result = int(op1 <= op2)
-                elif token == (">=", 2, 0, 1):
-                    result = int(op1 >= op2)
-                elif token == ("!=", 2, 0, 1):
-                    result = int(op1 != op2)
-                elif token == ("<", 2, 0, 1):
-                    result = int(op1 < op2)
-                elif token == (">", 2, 0, 1):
-                    result = int(op1 > op2)
-                elif token == ("+=", 2, 0, 0):
-                    result = op1 + op2
-                    error = set_variable(raw1, result, global_vars)
-                elif token == ("-=" , 2, 0, 0):
-                    result = raw1
-                    error = set_variable(raw1, op1 - op2, global_vars)
-                elif token == ("*=" , 2, 0, 0):
-                    result = raw1
-                    error = set_variable(raw1, op1 * op2, global_vars)
-                elif token == ("/=" , 2, 0, 0):
-                    try:
-                        result = raw1
-                        error = set_variable(raw1, op1 / op2, global_vars)
-                    except ZeroDivisionError:
-                        return "Error: Cannot divide by zero, silly guy."
-
-
-            elif operand_count == 1:
-                raw = stack[-1]
-                op = get_value(raw, global_vars)
-                del stack[-1]
-                if type(op) == str:
-                    return op
-
-                if token == ("-", 1, -1, 6):
-                    result = -op
-                elif token == ("!", 1, -1, 6):
-                    result = int(not op)
-                elif token == ("!", 1, 1, 5):
-                    if int(op) != op:
-                        return "Error: Factorial only supports integer operands." 
-                    result = math.factorial(op)
-                elif token == ("--", 1, 1, 5):
-                    result = raw    
-                    error = set_variable(raw, op-1, global_vars)
-                elif token == ("++", 1, 1, 5):
-                    result = raw
-                    error = set_variable(raw, op+1, global_vars)
-
-            if(error):
-                return error
-
-            stack.append(result)
-        
-        else:
-            #Is an integer
-            if re.fullmatch(r"[0-9]{1,}", token):
-                stack.append(int(token))
-            #Is a float
-            elif re.fullmatch(r"[0-9]*\.[0-9]{1,}", token):
-                stack.append(float(token))
+            if type(token) == tuple:
+                if token[0] == "(":
+                    error = call_function(token[1], stack, global_vars, functions)
+                else:
+                    error = operations[token](stack, global_vars)
+
+                if error:
+                    return error
+
+            #Is a number or a name
             else:
                 stack.append(token)
 
+    except ZeroDivisionError:
+        return "Error: Cannot divide by zero, silly guy."
+    except CalculatorError as error:
+        return str(error)
+    except (ArithmeticError, ValueError, TypeError) as error:
+        return f"Error: {error}."
+
     return stack[-1]
 
+def get_quoted_name(program):
+    """Returns the variable name a quoted argument consists of"""
+    if len(program.postfix) != 1 or type(program.postfix[0]) != str:
+        raise CalculatorError(f"Error: \"{program}\" is not a valid variable name.")
+    return program.postfix[0]
+
+class Table():
+    """The lazily evaluated (value, result) rows of a table() sweep.
+        The body is only compiled once and is executed with the variable
+        bound in a LocalScope, so the sweep doesn't overwrite it."""
+
+    def __init__(self, name, start, stop, step, body, global_vars):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.step = step
+        self.body = body
+        self.global_vars = global_vars
+
+    def __iter__(self):
+        """Yields each row, raising CalculatorError if the body fails"""
+        scope = LocalScope(self.global_vars)
+        name, program = self.name, compile_program(self.body.postfix)
+        start, step = self.start, self.step
+
+        #Compute each value from its index instead of accumulating floating point error
+        steps = (self.stop - start) / step
+        count = (round(steps) if abs(steps - round(steps)) < 1e-9 else math.floor(steps)) + 1
+        for i in range(max(count, 0)):
+            value = start + i * step
+            scope[name] = value
+            result = execute_program(program, scope)
+            if type(result) == str:
+                if result not in scope:
+                    raise CalculatorError(result)
+                result = scope[result]
+            yield value, result
+
+    def __str__(self):
+        return f"table({self.name}, {self.start}, {self.stop}, {self.step}, {self.body})"
+
+def table(global_vars, name, start, stop, step, body):
+    """Returns the lazy Table of the body evaluated with name swept from start to stop in steps of step"""
+    if step == 0 or (stop - start) * step < 0:
+        raise CalculatorError("Error: The step of a table must move from the start toward the stop.")
+    name = get_quoted_name(name)
+    if name in CONSTANTS: #Constants in the body were already folded, so sweeping one would change nothing
+        raise CalculatorError(f"Error: \"{name}\" is a constant and cannot be swept by a table.")
+    return Table(name, start, stop, step, body, global_vars)
+
+class LocalScope(dict):
+    """The variables of a function call or table sweep. Reads of names that aren't
+        local fall back to the parent scope, and assignments stay local."""
+    __slots__ = ("parent",)
+
+    def __init__(self, parent, variables=()):
+        super().__init__(variables)
+        self.parent = parent
+
+    def __missing__(self, name):
+        return self.parent[name]
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self.parent
+
+    def get(self, name, default=None):
+        #dict.get skips __missing__
+        return self[name] if name in self else default
+
+    @property
+    def functions(self):
+        return getattr(self.parent, "functions", None)
+
+MAX_CALL_DEPTH = 100 #Nested user function calls allowed before giving up on a recursive definition
+MEMO_SIZE = 4096 #Results remembered per pure user function
+call_depth = 0
+
+class UserFunction():
+    """A function defined in the calculator with f(x, y) = body. The body is compiled once,
+        when the function is defined, and executed with the arguments bound in a LocalScope.
+        If the body only reads its parameters, constants and pure functions, its results are memoized."""
+
+    def __init__(self, name, parameters, body, pure):
+        self.name = name
+        self.parameters = parameters
+        self.body = body #A postfix list or a generated Python function, like the programs in the expression cache
+        self.memo = {} if pure else None
+
+    def __call__(self, global_vars, arguments):
+        global call_depth
+
+        key = None
+        if self.memo is not None:
+            try:
+                key = tuple(zip(map(type, arguments), arguments)) #So that f(2) and f(2.0) keep their own types
+                return self.memo[key]
+            except KeyError:
+                pass
+            except TypeError:
+                key = None #Unhashable arguments, like arrays
+
+        if call_depth >= MAX_CALL_DEPTH:
+            raise CalculatorError(f"Error: \"{self.name}\" was called more than {MAX_CALL_DEPTH} calls deep.")
+        scope = LocalScope(global_vars, zip(self.parameters, arguments))
+        call_depth += 1
+        try:
+            result = execute_program(self.body, scope)
+        finally:
+            call_depth -= 1
+
+        if type(result) == str:
+            if result not in scope:
+                raise CalculatorError(result)
+            result = scope[result]
+
+        if key is not None:
+            if len(self.memo) >= MEMO_SIZE:
+                self.memo.clear()
+            self.memo[key] = result
+        return result
+
+    def __str__(self):
+        return f"{self.name}({', '.join(self.parameters)})"
+
+    def __reduce__(self):
+        #Generated Python bodies can't be pickled, so the body is sent as postfix and compiled again where it is loaded
+        return (load_user_function, (self.name, self.parameters, get_postfix(self.body), self.memo is not None))
+
+def compile_program(postfix):
+    """Compiles a postfix program, such as a function body or formula, the same way as the lines in the expression cache"""
+    if expression_cache.compiler is compile_line_to_python:
+        return compile_to_python(postfix) or postfix
+    return postfix
+
+def load_user_function(name, parameters, postfix, pure):
+    """Rebuilds a pickled user function, such as one sent to a worker process"""
+    return UserFunction(name, parameters, compile_program(postfix), pure)
+
+def is_pure_body(postfix, parameters, user_functions):
+    """Returns whether a function body only depends on its arguments, so its results can be memoized"""
+    for token in postfix:
+        if type(token) == str:
+            if token in parameters or token in CONSTANTS:
+                continue
+            if token in numeric_backend.functions and token not in IMPURE_FUNCTIONS:
+                continue
+            user_function = user_functions.get(token)
+            if user_function is None or user_function.memo is None:
+                return False
+        elif type(token) == Program or token in ASSIGNMENT_OPERATORS:
+            return False
+    return True
+
+def update_purity(user_functions):
+    """Decides again which functions are memoized, since a function is only pure while every function it calls is.
+        Repeats until nothing changes, so that the change reaches the callers of callers."""
+    changed = True
+    while changed:
+        changed = False
+        for user_function in user_functions.values():
+            pure = is_pure_body(get_postfix(user_function.body), user_function.parameters, user_functions)
+            if pure != (user_function.memo is not None):
+                user_function.memo = {} if pure else None
+                changed = True
+
+def define(global_vars, name, parameters, body):
+    """Defines a user function in global_vars and returns it"""
+    name = get_quoted_name(name)
+    parameters = tuple(get_quoted_name(Program([parameter])) for parameter in parameters.postfix)
+    user_functions = getattr(global_vars, "functions", None)
+    if user_functions is None:
+        raise CalculatorError(f"Error: The function, \"{name}\", can't be defined here.")
+    if name in numeric_backend.functions or name in SPECIAL_FORMS:
+        raise CalculatorError(f"Error: The function, \"{name}\", is built in and cannot be redefined.")
+    if len(set(parameters)) != len(parameters):
+        raise CalculatorError(f"Error: The parameters of \"{name}\" must have different names.")
+    for parameter in parameters:
+        if parameter in CONSTANTS:
+            raise CalculatorError(f"Error: \"{parameter}\" is a constant and cannot be a parameter.")
+
+    #Memoized results of other functions may have come from the old definition
+    with Uninterrupted():
+        user_functions.pop(name, None)
+        for user_function in user_functions.values():
+            if user_function.memo is not None:
+                user_function.memo.clear()
+
+        user_functions[name] = UserFunction(name, parameters, compile_program(body.postfix), is_pure_body(body.postfix, parameters, user_functions))
+        update_purity(user_functions)
+
+    formulas = getattr(global_vars, "formulas", None)
+    if formulas is not None:
+        formulas.recalculate(name, global_vars) #Formulas that call the function
+    return user_functions[name]
+
+#Functions whose quoted arguments are passed as unevaluated Programs instead of values.
+#Each one is called with global_vars followed by its arguments.
+#The dictionary stores a tuple with the number of arguments, the indices of the quoted arguments and the function
+SPECIAL_FORMS = {
+    "table" : (5, (0, 4), table),
+    "define" : (3, (0, 1, 2), define),
+}
+
 def get_value(token, global_vars):
     """If the value is already a valid operand, like a number or boolean, it's just returned
         If it is a variable name, then its value is retrieved from global scope and returned"""
-    if type(token) in [int, float]:
-        return token
-
-    elif type(token) == bool:
+    if type(token) != str:
         return token
     
-    elif token in global_vars.keys():
+    elif token in global_vars:
         return global_vars[token]
 
     else:
@@ -661,64 +1542,1629 @@ def set_variable(var, val, global_vars):
     """Add a varialbe to global_vars with the name var and the value val.
         var must be a valid variable name"""
     
-    if type(var)==str and re.fullmatch("([A-z|_|@][A-z|_|0-9|@]*)", var):
+    #Names are the only strings that can reach the execution stack
+    if type(var)==str and var in CONSTANTS:
+        return f"Error: \"{var}\" is a constant and cannot be assigned."
+    elif type(var)==str:
         global_vars[var] = val
+        formulas = getattr(global_vars, "formulas", None)
+        if formulas is not None:
+            formulas.unbind(var) #Assigning a value replaces the variable's formula
+            formulas.recalculate(var, global_vars)
     else:
         return f"Error: \"{var}\" is not a valid variable name."
 
-global_vars = {
+def get_formula_inputs(postfix):
+    """Returns the variable names a formula reads, not counting constants.
+        Raises CalculatorError if the formula assigns to a variable."""
+    inputs = set()
+    for token in postfix:
+        if type(token) == str:
+            if token not in CONSTANTS:
+                inputs.add(token)
+        elif type(token) == Program:
+            inputs |= get_formula_inputs(token.postfix)
+        elif token in ASSIGNMENT_OPERATORS:
+            raise CalculatorError("Error: A formula can't assign to variables.")
+    return inputs
+
+def same_value(value1, value2):
+    """Returns whether two values are known to be the same, so that what depends on them needn't be recomputed"""
+    try:
+        return type(value1) == type(value2) and bool(value1 == value2)
+    except (ArithmeticError, ValueError, TypeError):
+        return False
+
+class Formulas():
+    """The dependency graph of the variables bound to formulas with :=.
+        programs maps each formula's variable to its Program, compiled maps it to the Program compiled
+        like the lines in the expression cache, inputs maps it to the names the Program reads,
+        and dependents maps every name that is read to the formulas that read it."""
+
+    def __init__(self):
+        self.programs = {}
+        self.compiled = {}
+        self.inputs = {}
+        self.dependents = {}
+
+    def copy(self):
+        formulas = Formulas()
+        formulas.programs = dict(self.programs)
+        formulas.compiled = dict(self.compiled)
+        formulas.inputs = dict(self.inputs)
+        formulas.dependents = {name : set(readers) for name, readers in self.dependents.items()}
+        return formulas
+
+    def bind(self, name, program, global_vars):
+        """Binds name to the formula program, computes it and recalculates what depends on it.
+            Returns the error string if the formula can't be computed yet, in which case
+            name stays unassigned until the formula's inputs change."""
+        inputs = get_formula_inputs(program.postfix)
+        if name in inputs or not inputs.isdisjoint(self.downstream(name)):
+            raise CalculatorError(f"Error: \"{name}\" can't be bound to a formula that depends on \"{name}\".")
+
+        compiled = compile_program(program.postfix)
+        with Uninterrupted():
+            self.unbind(name)
+            self.programs[name] = program
+            self.compiled[name] = compiled
+            self.inputs[name] = inputs
+            for input_name in inputs:
+                self.dependents.setdefault(input_name, set()).add(name)
+
+        error = self.compute(name, global_vars)
+        self.recalculate(name, global_vars)
+        return error
+
+    def unbind(self, name):
+        """Turns a formula's variable back into a plain variable"""
+        with Uninterrupted():
+            if self.programs.pop(name, None) is None:
+                return
+            del self.compiled[name]
+            for input_name in self.inputs.pop(name):
+                readers = self.dependents[input_name]
+                readers.discard(name)
+                if not readers:
+                    del self.dependents[input_name]
+
+    def compute(self, name, global_vars):
+        """Recomputes the value of a formula's variable.
+            If the formula fails, the variable is left unassigned and the error string is returned."""
+        result = execute_program(self.compiled[name], global_vars)
+        if type(result) == str:
+            if result not in global_vars:
+                global_vars.pop(name, None)
+                return result
+            result = global_vars[result]
+        global_vars[name] = result
+
+    def downstream(self, name):
+        """Returns every formula that depends on name, directly or not, with each one after all of its inputs.
+            It is the reverse of the order a depth first search finishes the formulas in."""
+        order = []
+        visited = set()
+        stack = [(name, iter(self.dependents.get(name, ())))]
+        while stack:
+            formula, readers = stack[-1]
+            for reader in readers:
+                if reader not in visited:
+                    visited.add(reader)
+                    stack.append((reader, iter(self.dependents.get(reader, ()))))
+                    break
+            else:
+                stack.pop()
+                order.append(formula)
+        order.pop() #name itself
+        order.reverse()
+        return order
+
+    def recalculate(self, name, global_vars):
+        """Recomputes the formulas that depend on a variable after it changed, in topological order.
+            A formula is only recomputed if one of its inputs actually changed value,
+            so the work done is proportional to what changed rather than to the number of formulas."""
+        if name not in self.dependents:
+            return
+        dirty = set(self.dependents[name])
+        missing = object()
+        for formula in self.downstream(name):
+            if formula in dirty:
+                old_value = global_vars.get(formula, missing)
+                self.compute(formula, global_vars)
+                if not same_value(old_value, global_vars.get(formula, missing)):
+                    dirty.update(self.dependents.get(formula, ()))
+
+class Scope(dict):
+    """The variables of a calculator session, along with the Formulas bound to some of them and the user functions.
+        Plain dictionaries can be used as scopes too, but formulas and functions can't be defined in them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.formulas = Formulas()
+        self.functions = {} #User functions by name
+
+    def copy(self):
+        scope = Scope(self)
+        scope.formulas = self.formulas.copy()
+        scope.functions = dict(self.functions)
+        return scope
+
+def bind_formula(name, program, global_vars):
+    """Binds the variable name to a formula, so that it is recomputed whenever a variable the formula reads changes.
+        Returns an error string if the formula can't be bound or can't be computed yet."""
+    if type(name) != str:
+        return f"Error: \"{name}\" is not a valid variable name."
+    if name in CONSTANTS:
+        return f"Error: \"{name}\" is a constant and cannot be assigned."
+    formulas = getattr(global_vars, "formulas", None)
+    if formulas is None:
+        return f"Error: \"{name}\" can't be bound to a formula here."
+    return formulas.bind(name, program, global_vars)
+
+#Python source templates for the operators, filled in with the source of their operand values.
+#Assignment templates get the source of the variable name instead of its value for their first operand.
+PYTHON_OPERATORS = {
+    ("-", 1, -1, 6) : "(-{0})",
+    ("!", 1, -1, 6) : "int(not {0})",
+    ("!", 1, 1, 5) : "_factorial({0})",
+    ("--", 1, 1, 5) : "_update(g, {0}, _operator.sub, 1)",
+    ("++", 1, 1, 5) : "_update(g, {0}, _operator.add, 1)",
+
+    ("^", 2, 0, 4) : "_power({0}, {1})",
+
+    ("*", 2, 0, 3) : "({0} * {1})",
+    ("/", 2, 0, 3) : "({0} / {1})",
+    ("//", 2, 0, 3) : "({0} // {1})",
+    ("%", 2, 0, 3) : "({0} % {1})",
+
+    ("+", 2, 0, 2) : "({0} + {1})",
+    ("-", 2, 0, 2) : "({0} - {1})",
+
+    #Both operands are always evaluated, just like on the stack
+    ("&&", 2, 0, 2) : "_and({0}, {1})",
+    ("||", 2, 0, 2) : "_or({0}, {1})",
+
+    ("==", 2, 0, 1) : "int({0} == {1})",
+    ("<=", 2, 0, 1) : "int({0} <= {1})",
+    (">=", 2, 0, 1) : "int({0} >= {1})",
+    ("!=", 2, 0, 1) : "int({0} != {1})",
+    ("<", 2, 0, 1) : "int({0} < {1})",
+    (">", 2, 0, 1) : "int({0} > {1})",
+
+    ("=", 2, 0, 0) : "_set(g, {0}, {1})",
+    (":=", 2, 0, 0) : "_bind(g, {0}, {1})",
+    ("+=", 2, 0, 0) : "_update(g, {0}, _operator.add, {1})",
+    ("-=" , 2, 0, 0) : "_update(g, {0}, _operator.sub, {1})",
+    ("*=" , 2, 0, 0) : "_update(g, {0}, _operator.mul, {1})",
+    ("/=" , 2, 0, 0) : "_update(g, {0}, _operator.truediv, {1})",
+}
+
+PYTHON_FUNCTION_TEMPLATE = """def program(g):
+    try:
+        return {0}
+    except ZeroDivisionError:
+        return "Error: Cannot divide by zero, silly guy."
+    except _CalculatorError as error:
+        return str(error)
+    except (ArithmeticError, ValueError, TypeError) as error:
+        return f"Error: {{error}}."
+"""
+
+def python_get(global_vars, name):
+    value = get_value(name, global_vars)
+    if type(value) == str:
+        raise CalculatorError(value)
+    return value
+
+def python_set(global_vars, name, value):
+    error = set_variable(name, value, global_vars)
+    if error:
+        raise CalculatorError(error)
+    return name
+
+def python_bind(global_vars, name, program):
+    error = bind_formula(name, program, global_vars)
+    if error:
+        raise CalculatorError(error)
+    return name
+
+def python_update(global_vars, name, function, value):
+    return python_set(global_vars, name, function(python_get(global_vars, name), value))
+
+def python_call(global_vars, function_name, *arguments):
+    """Calls a function that couldn't be resolved at compile time, with the same checks as execute_postfix"""
+    stack = [function_name, *arguments]
+    error = call_function(len(arguments), stack, global_vars)
+    if error:
+        raise CalculatorError(error)
+    return stack[-1]
+
+PYTHON_NAMESPACE = {
+    "_get" : python_get,
+    "_set" : python_set,
+    "_bind" : python_bind,
+    "_update" : python_update,
+    "_call" : python_call,
+    "_and" : (lambda op1, op2: int(op1 and op2)),
+    "_or" : (lambda op1, op2: int(op1 or op2)),
+    "_factorial" : factorial,
+    "_power" : power,
+    "_operator" : operator,
+    "_CalculatorError" : CalculatorError,
+}
+
+def generate_python(postfix):
+    """Returns the Python source of an expression equivalent to a postfix program,
+        along with the namespace of the objects it refers to, or None if it can't be generated.
+        Each simulated stack entry is (source, is_name, token), where is_name entries evaluate
+        to a variable name, and token is the operand the entry came from, if any."""
+    namespace = dict(PYTHON_NAMESPACE)
+    functions = numeric_backend.functions
+    stack = []
+
+    def add_object(value):
+        key = f"_k{len(namespace)}"
+        namespace[key] = value
+        return key
+
+    def value_of(entry):
+        source, is_name, token = entry
+        return f"_get(g, {source})" if is_name else source
+
+    for token in postfix:
+        if type(token) != tuple:
+            if type(token) == str:
+                stack.append((repr(token), True, token))
+            elif (type(token) == int and abs(token) < 2**64) or (type(token) == float and math.isfinite(token)):
+                stack.append((repr(token), False, token))
+            else:
+                stack.append((add_object(token), False, token))
+            continue
+
+        popped = get_stack_effect(token)
+        if popped > len(stack):
+            return None
+        operands = stack[len(stack) - popped:]
+        del stack[len(stack) - popped:]
+
+        if token[0] == "(":
+            name_source, is_name, function_name = operands[0]
+            arguments = ", ".join(value_of(entry) for entry in operands[1:])
+            special_form = SPECIAL_FORMS.get(function_name) if is_name else None
+
+            #Resolve the function now if its name is known, otherwise look it up when it is called
+            if special_form is not None and special_form[0] == token[1]:
+                source = f"{add_object(special_form[2])}(g, {arguments})"
+            elif special_form is None and is_name and function_name in functions and functions[function_name][0] in (None, token[1]):
+                source = f"{add_object(functions[function_name][1])}({arguments})"
+            else:
+                source = f"_call(g, {name_source}, {arguments})"
+            stack.append((source, False, None))
+
+        elif token in ASSIGNMENT_OPERATORS:
+            variable = operands[0][0]
+            values = [value_of(entry) for entry in operands[1:]]
+            stack.append((PYTHON_OPERATORS[token].format(variable, *values), True, None))
+
+        else:
+            values = [value_of(entry) for entry in operands]
+            stack.append((PYTHON_OPERATORS[token].format(*values), False, None))
+
+    if not stack:
+        return None
+    return stack[-1][0], namespace
+
+def compile_to_python(postfix):
+    """Compiles a postfix program into a Python function of global_vars so that CPython's own
+        evaluator does the work. The function returns the same results and error strings as
+        execute_postfix, though if several operands fail a different one may be reported first.
+        The function keeps the program in its postfix attribute. Returns None if the program
+        can't be compiled, for example if it is nested too deeply for the Python parser."""
+    generated = generate_python(postfix)
+    if generated is None:
+        return None
+
+    source, namespace = generated
+    try:
+        exec(compile(PYTHON_FUNCTION_TEMPLATE.format(source), "<calculator>", "exec"), namespace)
+    except (SyntaxError, RecursionError, MemoryError):
+        return None
+
+    program = namespace["program"]
+    program.postfix = postfix
+    return program
+
+#Read-only variables. Programs that use them can be constant folded when they are compiled.
+CONSTANTS = types.MappingProxyType({
     "pi" : math.pi,
     "e" : math.e,
     "tau" : math.tau,
+})
+
+global_vars = Scope({
+    **CONSTANTS,
     "inf" : math.inf,
     "@" : 0,
     "true" : 1,
     "false" : 0,
-}
+})
 
-if __name__ == "__main__":
-    print("Welcome to calculator.")
-    last_line = ""
-    while True:
-        line = input("\n>> ")
-        
-        if line == "":
-            line = last_line
+class NumericBackend():
+    """A numeric type the calculator computes with.
+        convert turns any number into the backend's type, number_types are the types
+        its programs can hold as literals, constants has the values of CONSTANTS,
+        and functions is its function table, laid out like FUNCTIONS."""
+
+    def __init__(self, name, convert, number_types, constants, functions):
+        self.name = name
+        self.convert = convert
+        self.number_types = number_types
+        self.constants = constants
+        self.functions = functions
+
+    def __str__(self):
+        return self.name
+
+def float_fallback(function, convert=None):
+    """Wraps a float function so it can be called with any numbers, converting the result with convert"""
+    def wrapper(*arguments):
+        result = function(*[float(arg) for arg in arguments])
+        if convert is not None and (type(result) == int or type(result) == float):
+            return convert(result)
+        return result
+    return wrapper
+
+def integer_arguments(function):
+    """Wraps a function of integers so it can be called with integral values of any numeric type"""
+    def wrapper(*arguments):
+        for arg in arguments:
+            if int(arg) != arg:
+                raise CalculatorError(f"Error: {arg} is not an integer.")
+        return function(*[int(arg) for arg in arguments])
+    return wrapper
+
+#Functions made only of arithmetic and comparisons, which already work with every numeric type
+ARITHMETIC_FUNCTIONS = frozenset(["exit", "abs", "sign", "floor", "ceil", "dot2", "dot3",
+                                  "sum", "mean", "var", "stdev", "min", "max", "median", "hypot",
+                                  "vec", "matrix", "dot", "transpose", "cross", "vecangle"])
+INTEGER_FUNCTIONS = frozenset(["perm", "chose"])
+
+def build_backend_functions(convert):
+    """Returns a function table where everything that isn't pure arithmetic works through floats"""
+    functions = {}
+    for name, (arg_count, function) in FUNCTIONS.items():
+        if name in ARITHMETIC_FUNCTIONS:
+            functions[name] = (arg_count, function)
+        elif name in INTEGER_FUNCTIONS:
+            functions[name] = (arg_count, integer_arguments(function))
         else:
-            last_line = line
+            functions[name] = (arg_count, float_fallback(function, convert))
+    return functions
+
+def convert_float(value):
+    if type(value) == int or type(value) == float:
+        return value
+    return float(value)
+
+FLOAT_BACKEND = NumericBackend("float", convert_float, (int, float), CONSTANTS, FUNCTIONS)
+
+numeric_backend = FLOAT_BACKEND
+
+def make_decimal_backend(precision):
+    """Returns a backend of decimal.Decimal numbers with precision significant digits.
+        If floats already carry that many digits, the float backend is returned instead."""
+    if precision <= sys.float_info.dig:
+        return FLOAT_BACKEND
+
+    import decimal
+    Decimal = decimal.Decimal
+    decimal.getcontext().prec = precision
+
+    def convert(value):
+        if type(value) == float:
+            return Decimal(repr(value))
+        return Decimal(value)
+
+    #Recipes from the decimal module documentation, computed with two guard digits in a local context,
+    #   so that the precision is restored even if the computation fails or is stopped
+    @functools.lru_cache(maxsize=8)
+    def compute_pi(precision):
+        """pi to precision significant digits"""
+        with decimal.localcontext() as context:
+            context.prec = precision + 2
+            three = Decimal(3)
+            lasts, t, s, n, na, d, da = 0, three, 3, 1, 0, 0, 24
+            while s != lasts:
+                lasts = s
+                n, na = n + na, na + 8
+                d, da = d + da, da + 32
+                t = (t * n) / d
+                s += t
+            context.prec = precision
+            return +s
+
+    def reduce_angle(x):
+        """Returns x modulo 2*pi, between -pi and pi, so that the series converge quickly.
+            pi is taken to as many more digits as x has before the point, so that no precision is lost."""
+        magnitude = x.adjusted() + 1
+        if magnitude <= 0:
+            return x
+        with decimal.localcontext() as context:
+            context.prec += magnitude
+            x = x.remainder_near(2 * compute_pi(context.prec))
+        return +x
+
+    def sin(x):
+        with decimal.localcontext() as context:
+            context.prec += 2
+            x = reduce_angle(convert(x))
+            i, lasts, s, fact, num, sign = 1, 0, x, 1, x, 1
+            while s != lasts:
+                lasts = s
+                i += 2
+                fact *= i * (i-1)
+                num *= x * x
+                sign *= -1
+                s += num / fact * sign
+        return +s
+
+    def cos(x):
+        with decimal.localcontext() as context:
+            context.prec += 2
+            x = reduce_angle(convert(x))
+            i, lasts, s, fact, num, sign = 0, 0, 1, 1, 1, 1
+            while s != lasts:
+                lasts = s
+                i += 2
+                fact *= i * (i-1)
+                num *= x * x
+                sign *= -1
+                s += num / fact * sign
+        return +s
+
+    pi = compute_pi(precision)
+    constants = types.MappingProxyType({"pi" : pi, "e" : Decimal(1).exp(), "tau" : 2 * pi})
+
+    functions = build_backend_functions(convert)
+    functions.update({
+        "sin" : (1, sin),
+        "cos" : (1, cos),
+        "tan" : (1, (lambda x : sin(x) / cos(x))),
+        "deg" : (1, (lambda x : convert(x) * 180 / pi)),
+        "rad" : (1, (lambda x : convert(x) * pi / 180)),
+
+        "log10" : (1, (lambda x : convert(x).log10())),
+        "log2" : (1, (lambda x : convert(x).ln() / Decimal(2).ln())),
+        "loge" : (1, (lambda x : convert(x).ln())),
+        "logbase" : (2, (lambda x, base : convert(x).ln() / convert(base).ln())),
+        "sqrt" : (1, (lambda x : convert(x).sqrt())),
+        "root" : (2, (lambda x, n : convert(n) ** (1 / convert(x)))),
+        "mag" : (3, (lambda x, y, z : convert(x**2 + y**2 + z**2).sqrt())),
+    })
+
+    return NumericBackend(f"decimal({precision})", convert, (int, float, Decimal), constants, types.MappingProxyType(functions))
+
+def make_fraction_backend():
+    """Returns a backend of exact fractions.Fraction numbers.
+        Functions and constants without an exact value, like sin and pi, give floats."""
+    import fractions
+    Fraction = fractions.Fraction
+
+    def convert(value):
+        if type(value) == float and not math.isfinite(value):
+            return value
+        if type(value) == float:
+            return Fraction(repr(value))
+        return Fraction(value)
+
+    def sqrt(x):
+        x = Fraction(x)
+        if x >= 0:
+            numerator, denominator = math.isqrt(x.numerator), math.isqrt(x.denominator)
+            if numerator**2 == x.numerator and denominator**2 == x.denominator:
+                return Fraction(numerator, denominator)
+        return math.sqrt(x)
+
+    functions = build_backend_functions(None)
+    functions["sqrt"] = (1, sqrt)
+
+    #pi, e and tau are irrational, so they stay floats
+    return NumericBackend("fraction", convert, (int, float, Fraction), CONSTANTS, types.MappingProxyType(functions))
+
+def convert_literals(postfix, convert):
+    """Converts the number literals of a postfix program, including quoted Programs, with convert"""
+    converted = []
+    for token in postfix:
+        if type(token) == int or type(token) == float:
+            token = convert(token)
+        elif type(token) == Program:
+            token = Program(convert_literals(token.postfix, convert))
+        converted.append(token)
+    return converted
+
+def get_backend(name):
+    """Returns the backend with the given name, which is how other processes recreate the current backend"""
+    if name == "fraction":
+        return make_fraction_backend()
+    elif name.startswith("decimal("):
+        return make_decimal_backend(int(name[len("decimal("):-1]))
+    return FLOAT_BACKEND
+
+def set_backend(backend, global_vars):
+    """Makes backend the numeric backend. The constants and numbers in global_vars are converted
+        and the compiled programs are thrown away, since their literals have the old type."""
+    global numeric_backend
+    numeric_backend = backend
+    expression_cache.clear()
+
+    for name, value in global_vars.items():
+        if name in CONSTANTS:
+            global_vars[name] = backend.constants[name]
+        else:
+            global_vars[name] = convert_number(value, backend)
+
+def convert_number(value, backend):
+    """Returns a number converted to the number type of backend. Integers and anything that isn't a number are returned as they are."""
+    import numbers
+
+    if type(value) not in (int, bool, str) and isinstance(value, numbers.Number):
+        try:
+            return backend.convert(value)
+        except (ValueError, OverflowError):
+            pass
+    return value
+
+class ExpressionCache():
+    """A bounded LRU cache mapping source lines to their compiled programs.
+        Only the compiled form is stored, never results, so lines with assignments stay correct.
+        compiler turns a line into a program or an error string and defaults to compile_line."""
+
+    def __init__(self, maxsize=256, compiler=None):
+        self.maxsize = maxsize
+        self.compiler = compiler
+        self.programs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loader = None #Called on the first miss for saved (line, program) pairs to load
+
+    def get(self, line, compiler=None):
+        """Returns the compiled program for line, compiling and storing it on a miss.
+            Compilation errors are returned as strings and are not cached.
+            compiler, if given, is used instead of the cache's own compiler on a miss."""
+        program = self.programs.get(line)
+        if program is not None:
+            self.hits += 1
+            self.programs.move_to_end(line)
+            return program
+
+        if self.loader is not None:
+            loader, self.loader = self.loader, None
+            self.load(loader())
+            if line in self.programs:
+                return self.get(line)
+
+        self.misses += 1
+        program = (compiler or self.compiler or compile_line)(line)
+        if type(program) == str:
+            return program
+
+        self.programs[line] = program
+        if len(self.programs) > self.maxsize:
+            self.programs.popitem(last=False)
+            self.evictions += 1
+
+        return program
+
+    def load(self, entries):
+        """Adds (line, program) pairs, oldest first, behind the programs already in the cache"""
+        for line, program in entries:
+            if line not in self.programs:
+                self.programs[line] = program
+                self.programs.move_to_end(line, last=False)
+        while len(self.programs) > self.maxsize:
+            self.programs.popitem(last=False)
+
+    def clear(self):
+        self.programs.clear()
+
+    def __len__(self):
+        return len(self.programs)
 
-        tokens = tokenize(line)
+    def __str__(self):
+        return f"cache: {len(self)}/{self.maxsize} programs, {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+def compile_forms(postfix):
+    """Quotes the arguments of special forms and turns function definitions into calls to define"""
+    return compile_definitions(compile_special_forms(postfix))
+
+def convert_backend_literals(postfix):
+    """Converts the number literals of a postfix program to the type of the numeric backend"""
+    if numeric_backend is FLOAT_BACKEND:
+        return postfix
+    return convert_literals(postfix, numeric_backend.convert)
+
+#The stages of the front end of the pipeline, in order. The first one is given the line
+#and each one after it is given the output of the one before it. They return an error string if they fail.
+COMPILE_STAGES = (
+    ("tokenize", tokenize),
+    ("parse", parse),
+    ("to_postfix", to_postfix),
+    ("compile_forms", compile_forms),
+    ("convert_literals", convert_backend_literals),
+    ("fold_constants", fold_constants),
+)
+
+def compile_line(line):
+    """Runs the front end of the pipeline on a line and returns its postfix program.
+        If any stage fails, the error string is returned instead."""
+    program = line
+    for name, stage in COMPILE_STAGES:
+        program = stage(program)
+        if type(program) == str:
+            return program
+    return program
+
+def compile_line_to_python(line):
+    """Compiles a line into a generated Python function, or just its postfix program
+        if it can't be turned into Python. Returns an error string if compilation fails."""
+    postfix = compile_line(line)
+    if type(postfix) == str:
+        return postfix
+
+    program = compile_to_python(postfix)
+    if program is None:
+        return postfix
+    return program
+
+def get_postfix(program):
+    """Returns the postfix form of a compiled program"""
+    if type(program) == list:
+        return program
+    return program.postfix
+
+def execute_program(program, global_vars):
+    """Executes a compiled program, which is either a postfix list or a generated Python function.
+        Programs that read arrays always run through the vectorized tables."""
+    postfix = get_postfix(program)
+    if uses_arrays(postfix, global_vars):
+        return execute_vectorized(postfix, global_vars)
+    if type(program) == list:
+        return execute_postfix(program, global_vars)
+    return program(global_vars)
+
+expression_cache = ExpressionCache()
+
+def build_vector_tables(numpy):
+    """Returns the operations and functions tables with every entry replaced by its NumPy ufunc equivalent,
+        so that a postfix program can be executed once over whole arrays"""
+
+    def boolean(ufunc):
+        return lambda *operands: ufunc(*operands).astype(int)
+
+    def elementwise(function, arg_count):
+        return numpy.frompyfunc(function, arg_count, 1)
+
+    operations = dict(OPERATIONS)
+    operations.update({
+        ("!", 1, -1, 6) : unary_operation(boolean(numpy.logical_not)),
+        ("!", 1, 1, 5) : unary_operation(elementwise(factorial, 1)),
+
+        ("&&", 2, 0, 2) : binary_operation(boolean(numpy.logical_and)),
+        ("||", 2, 0, 2) : binary_operation(boolean(numpy.logical_or)),
+
+        ("==", 2, 0, 1) : binary_operation(boolean(numpy.equal)),
+        ("<=", 2, 0, 1) : binary_operation(boolean(numpy.less_equal)),
+        (">=", 2, 0, 1) : binary_operation(boolean(numpy.greater_equal)),
+        ("!=", 2, 0, 1) : binary_operation(boolean(numpy.not_equal)),
+        ("<", 2, 0, 1) : binary_operation(boolean(numpy.less)),
+        (">", 2, 0, 1) : binary_operation(boolean(numpy.greater)),
+    })
+
+    ufuncs = {
+        "sin" : numpy.sin,
+        "cos" : numpy.cos,
+        "tan" : numpy.tan,
+        "atan" : numpy.arctan,
+        "atan2" : numpy.arctan2,
+        "asin" : numpy.arcsin,
+        "acos" : numpy.arccos,
+        "deg" : numpy.degrees,
+        "rad" : numpy.radians,
+
+        "floor" : (lambda x : numpy.floor(x).astype(int)),
+        "ceil" : (lambda x : numpy.ceil(x).astype(int)),
+        "abs" : numpy.abs,
+        "sign" : numpy.sign,
+
+        "log10" : numpy.log10,
+        "log2" : numpy.log2,
+        "loge" : numpy.log,
+        "logbase" : (lambda x, base : numpy.log(x) / numpy.log(base)),
+        "sqrt" : numpy.sqrt,
+
+        "mag" : (lambda x, y, z : numpy.sqrt(x**2 + y**2 + z**2)),
+        "vecangle" : (lambda ax, ay, az, bx, by, bz : numpy.arccos(dot3(ax, ay, az, bx, by, bz) /
+                        (numpy.sqrt(ax**2 + ay**2 + az**2) * numpy.sqrt(bx**2 + by**2 + bz**2)))),
+    }
+
+    #Functions built from arithmetic operators already work on arrays,
+    #   and anything without an equivalent is applied element by element
+    functions = {}
+    for name, (arg_count, function) in FUNCTIONS.items():
+        if name in ufuncs:
+            functions[name] = (arg_count, ufuncs[name])
+        elif name in ["exit", "root", "dot2", "dot3", "linspace", "arange", "dot", "transpose"] or arg_count is None:
+            functions[name] = (arg_count, function)
+        else:
+            functions[name] = (arg_count, elementwise(function, arg_count))
 
-        terminal_vars = parse(tokens)
-        if type(terminal_vars) == str:
-            print(terminal_vars)
-            continue
+    return types.MappingProxyType(operations), types.MappingProxyType(functions)
 
-        tokens = replace_operators(terminal_vars)
+vector_tables = None
 
+def execute_vectorized(postfix, global_vars):
+    """Executes a postfix program once with NumPy arrays as operands and returns an array.
+        Division by zero anywhere in an array is reported as an error instead of producing inf."""
+    global vector_tables
+    numpy = get_numpy()
+    if vector_tables is None:
+        vector_tables = build_vector_tables(numpy)
 
-        if type(tokens) == str:
-            print(tokens)
-            continue
+    with numpy.errstate(divide="raise"):
+        return execute_postfix(postfix, global_vars, *vector_tables)
 
-        postfix = to_postfix(tokens)
-        #If postfix threw an error
-        if type(postfix) == str:
-            print(postfix)
-            continue
+def uses_arrays(postfix, global_vars):
+    """Returns true if the postfix program reads any variable bound to a NumPy array"""
+    if numpy is None:
+        return False
+    for token in postfix:
+        if type(token) == str and isinstance(global_vars.get(token), numpy.ndarray):
+            return True
+    return False
+
+def evaluate_over(line, bindings, global_vars, cache=expression_cache):
+    """Evaluates a line once with the variables in bindings bound to arrays and returns the resulting array.
+        global_vars is not modified. If compilation or execution fails, the error string is returned."""
+    try:
+        numpy = get_numpy()
+    except CalculatorError as error:
+        return str(error)
+
+    program = cache.get(line)
+    if type(program) == str:
+        return program
+
+    scope = dict(global_vars)
+    for name, values in bindings.items():
+        scope[name] = numpy.asarray(values)
+
+    try:
+        result = execute_vectorized(get_postfix(program), scope)
+    except CalculatorError as error:
+        return str(error)
+    return get_value(result, scope)
+
+def format_value(value):
+    """Returns the display text of a value. Integers too long to convert to a string
+        are shown in scientific notation with their digit count."""
+    try:
+        return str(value)
+    except ValueError:
+        import decimal
+        #Only the leading bits are converted, since converting the whole integer to a Decimal takes quadratic time.
+        #   The magnitude lies between the leading bits and the leading bits plus one unit of their last place.
+        shift = max(0, value.bit_length() - 128)
+        leading_bits = abs(value) >> shift
+        lower = decimal.Context(prec=40, Emax=decimal.MAX_EMAX, rounding=decimal.ROUND_DOWN)
+        upper = decimal.Context(prec=40, Emax=decimal.MAX_EMAX, rounding=decimal.ROUND_UP)
+        leading = lower.multiply(decimal.Decimal(leading_bits), lower.power(2, shift))
+        digits = leading.adjusted() + 1
+        if upper.multiply(decimal.Decimal(leading_bits + 1), upper.power(2, shift)).adjusted() + 1 != digits:
+            #The bounds straddle a power of ten, which only the whole integer can settle
+            digits += abs(value) >= 10 ** digits
+        if value < 0:
+            leading = -leading
+        return f"{decimal.Context(prec=20, Emax=decimal.MAX_EMAX).create_decimal(leading)} ({digits} digits)"
+
+def table_lines(table, global_vars):
+    """Lazily formats the rows of a table and leaves the last result in @"""
+    result = None
+    try:
+        for value, result in table:
+            yield f"{format_value(value)}\t{format_value(result)}"
+    except CalculatorError as error:
+        yield str(error)
+        return
+
+    if result is not None:
+        set_variable("@", result, global_vars)
+
+def evaluate(line, global_vars, cache=expression_cache):
+    """Compiles (or fetches from the cache) and executes a line, updating @.
+        Returns the text that should be displayed for the line,
+        or a lazy iterable of lines if the result is a table."""
+
+    if line[:1] == ":" and line[1:2].isalpha():
+        return run_command(line, global_vars)
+    if profiler is not None:
+        return profiler.evaluate(line, global_vars, cache)
+
+    program = cache.get(line)
+    #If compilation threw an error
+    if type(program) == str:
+        return program
+
+    return display_result(execute_program(program, global_vars), global_vars)
+
+def display_result(result, global_vars):
+    """Returns the text that should be displayed for the result of a line and updates @"""
+    if type(result) == str:
+        if result in global_vars.keys():
+            value = get_value(result, global_vars)
+            output = f"{result}  :  {format_value(value)}"
+            result = value
+        else:
+            return result
+    elif type(result) == Table:
+        return table_lines(result, global_vars)
+    elif type(result) == UserFunction:
+        return str(result)
+    else:
+        output = format_value(result)
 
-        result = execute_postfix(postfix, global_vars)
-        
-        if type(result) == str:
-            if result in global_vars.keys():
-                value = get_value(result, global_vars)
-                print(result, " : ", value)
-                result = value
+    set_variable("@", result, global_vars) #update the answer variable
+    return output
 
+def count_invocations(postfix, operators, functions):
+    """Counts the operators and function calls in a postfix program, and in its quoted Programs, into two Counters.
+        Operators are counted by how they are written, with x standing in for the operands of unary operators."""
+    entries = [] #The first token of the code for each value on the simulated stack
+    for token in postfix:
+        if type(token) == Program:
+            count_invocations(token.postfix, operators, functions)
+        popped = get_stack_effect(token)
+        if popped > len(entries):
+            return
+        first = entries[len(entries) - popped] if popped else token
+        del entries[len(entries) - popped:]
+
+        if type(token) == tuple:
+            if token[0] == "(":
+                functions[first] += 1
             else:
-                print(result)
+                symbol, operand_count, position, precedence = token
+                operators[{-1 : f"{symbol}x", 0 : symbol, 1 : f"x{symbol}"}[position]] += 1
+        entries.append(first)
+
+def format_histogram(counts, label, width=40):
+    """Returns the lines of a text histogram of a Counter, in order of its keys"""
+    most = max(counts.values(), default=0)
+    return [f"  {label(key):>16}  {'#' * max(1, round(count / most * width)):<{width}} {count}" for key, count in sorted(counts.items())]
+
+class Profiler():
+    """Records how long each stage of the pipeline takes for the lines evaluated while profiling is on.
+        Only aggregates are kept: the time and a histogram of each stage, the operators and
+        functions of the executed programs, and the slowest lines. Rows of tables are computed
+        while they are written, so they aren't included in the time of their line."""
+
+    STAGES = tuple(name for name, stage in COMPILE_STAGES) + ("compile_to_python", "execute", "display")
+
+    def __init__(self, top=10):
+        import time
+        self.clock = time.perf_counter
+        self.top = top
+        self.reset()
+
+    def reset(self):
+        self.lines = 0
+        self.tokens = 0
+        self.stage_times = {stage : 0.0 for stage in Profiler.STAGES}
+        self.stage_counts = Counter()
+        self.histograms = {stage : Counter() for stage in Profiler.STAGES + ("line",)}
+        self.operators = Counter()
+        self.functions = Counter()
+        self.slowest = [] #A heap of the top (seconds, line number, line, token count)
+
+    def record(self, stage, seconds):
+        self.stage_times[stage] += seconds
+        self.stage_counts[stage] += 1
+        self.histograms[stage][int(seconds * 1e6).bit_length()] += 1
+
+    def time(self, stage, function, *args):
+        start = self.clock()
+        result = function(*args)
+        self.record(stage, self.clock() - start)
+        return result
+
+    def compile(self, line, compiler):
+        """Compiles a line like compiler would, timing each stage"""
+        self.line_tokens = 0
+        program = line
+        for stage, function in COMPILE_STAGES:
+            program = self.time(stage, function, program)
+            if type(program) == str:
+                return program
+            if stage == "tokenize":
+                self.line_tokens = len(program)
+
+        if compiler is compile_line_to_python:
+            program = self.time("compile_to_python", compile_to_python, program) or program
+        return program
+
+    def evaluate(self, line, global_vars, cache):
+        """Evaluates a line like evaluate does, while recording it"""
+        import heapq
+
+        start = self.clock()
+        self.line_tokens = None
+        program = cache.get(line, lambda line: self.compile(line, cache.compiler))
+        if type(program) == str:
+            output = program
+        else:
+            result = self.time("execute", execute_program, program, global_vars)
+            output = self.time("display", display_result, result, global_vars)
+            count_invocations(get_postfix(program), self.operators, self.functions)
+        seconds = self.clock() - start
+
+        self.lines += 1
+        self.histograms["line"][int(seconds * 1e6).bit_length()] += 1
+        if self.line_tokens is not None:
+            self.tokens += self.line_tokens
+        entry = (seconds, -self.lines, line, self.line_tokens)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+        return output
+
+    def report(self):
+        """Returns the lines of a report of everything recorded since profiling was turned on or reset"""
+        def bucket(bits):
+            return "< 1 us" if bits == 0 else f"{2 ** (bits - 1)}-{2 ** bits - 1} us"
+
+        total = sum(self.stage_times.values()) or 1
+        compiled = self.stage_counts["tokenize"]
+        lines = [f"Profiled {self.lines} lines, {compiled} of them compiled ({self.tokens} tokens) and {self.lines - compiled} from the cache.",
+                 "",
+                 f"  {'stage':<18} {'calls':>8} {'total ms':>10} {'mean us':>10} {'share':>7}"]
+        for stage in Profiler.STAGES:
+            count = self.stage_counts[stage]
+            if count:
+                seconds = self.stage_times[stage]
+                lines.append(f"  {stage:<18} {count:>8} {seconds * 1e3:>10.3f} {seconds / count * 1e6:>10.2f} {seconds / total:>7.1%}")
+
+        lines += ["", "Time per line:"] + format_histogram(self.histograms["line"], bucket)
+        for stage in ("tokenize", "parse", "execute"):
+            if self.histograms[stage]:
+                lines += ["", f"Time per {stage}:"] + format_histogram(self.histograms[stage], bucket)
+
+        for title, counts in (("Operators", self.operators), ("Functions", self.functions)):
+            if counts:
+                lines += ["", f"{title}: " + ", ".join(f"{name} {count}" for name, count in counts.most_common())]
+
+        lines += ["", "Slowest lines:"]
+        for seconds, order, line, tokens in sorted(self.slowest, reverse=True):
+            lines.append(f"  {seconds * 1e6:>10.1f} us  {'cached' if tokens is None else f'{tokens} tokens':>10}  {line}")
+        return lines
+
+profiler = None #The Profiler while profiling is on
+
+def profile_command(global_vars, argument):
+    """:profile on, :profile off, :profile reset or :profile to see the report"""
+    global profiler
+    if argument == "on":
+        if profiler is None:
+            profiler = Profiler()
+        return "Profiling is on."
+    elif profiler is None:
+        return "Profiling is off. Turn it on with :profile on"
+    elif argument == "off":
+        report, profiler = profiler.report(), None
+        return report + ["", "Profiling is off."]
+    elif argument == "reset":
+        profiler.reset()
+        return "Profiling was reset."
+    elif argument == "":
+        return profiler.report()
+    return f"Error: \"{argument}\" isn't an option of :profile."
+
+TEXT_EXTENSIONS = {".csv" : ",", ".tsv" : "\t", ".txt" : ","} #Delimiters of the text files :load reads. Other files are raw doubles.
+
+def column_name(text):
+    """Turns a column heading into a variable name"""
+    name = "".join(character if character.isalnum() or character == "_" else "_" for character in text.strip())
+    if name == "" or name[0].isdigit():
+        name = "_" + name
+    return name
+
+def as_column(values):
+    """Returns a column of floats as a NumPy array over the same memory if NumPy is installed, so that expressions
+        using it are vectorized, and otherwise as a Vector"""
+    try:
+        return get_numpy().asarray(values)
+    except CalculatorError:
+        if type(values) == memoryview and values.contiguous:
+            column = array("d")
+            column.frombytes(values.cast("B"))
+            return Vector(column)
+        return Vector(values if type(values) == array else array("d", values))
+
+def read_binary_columns(path, count):
+    """Memory-maps a file of native doubles, stored a row at a time, and returns a view of each of its count columns.
+        Nothing is read until the columns are used."""
+    import mmap
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return [array("d") for i in range(count)]
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapping) % (8 * count):
+        raise CalculatorError(f"Error: The size of {path} isn't a multiple of {count} doubles.")
+    values = memoryview(mapping).cast("d")
+    return [values[i::count] for i in range(count)]
+
+def read_text_columns(path, delimiter, names):
+    """Parses a delimited text file a row at a time into one float array, and then splits it into a float array per column.
+        The first row is used as the column names if it isn't all numbers.
+        Returns the names and the columns."""
+    import csv
+    values = array("d")
+    count = None
+    with open(path, newline="") as file:
+        for line_number, row in enumerate(csv.reader(file, delimiter=delimiter), 1):
+            if not row:
+                continue
+            if count is None:
+                count = len(row)
+                try:
+                    values.extend(map(float, row))
+                except ValueError:
+                    del values[:] #Any numbers at the start of the headings
+                    names = names or [column_name(field) for field in row]
+                continue
+            if len(row) != count:
+                raise CalculatorError(f"Error: Line {line_number} of {path} has {len(row)} values instead of {count}.")
+            try:
+                values.extend(map(float, row))
+            except ValueError:
+                raise CalculatorError(f"Error: Line {line_number} of {path} has a value that isn't a number.")
+    if count is None:
+        return names, []
+    return names, [values[i::count] for i in range(count)]
+
+def load_command(global_vars, argument):
+    """:load FILE [NAME ...] loads the columns of a data file into variables"""
+    import shlex
+    try:
+        words = shlex.split(argument)
+    except ValueError as error:
+        return f"Error: {error}."
+    if not words:
+        return "Error: :load needs a file, e.g. :load data.csv"
+    path, names = os.path.expanduser(words[0]), words[1:]
+    for name in names:
+        if column_name(name) != name:
+            return f"Error: \"{name}\" is not a valid variable name."
+
+    stem, extension = os.path.splitext(os.path.basename(path))
+    try:
+        if extension.lower() in TEXT_EXTENSIONS:
+            names, columns = read_text_columns(path, TEXT_EXTENSIONS[extension.lower()], names)
+        else:
+            columns = read_binary_columns(path, max(1, len(names)))
+    except OSError as error:
+        return f"Error: {path} couldn't be read ({error.strerror or error})."
+    except CalculatorError as error:
+        return str(error)
+
+    if not names:
+        names = [column_name(stem)] if len(columns) == 1 else [column_name(stem) + str(i + 1) for i in range(len(columns))]
+    if len(names) != len(columns):
+        return f"Error: {path} has {len(columns)} columns, but {len(names)} names were given."
+
+    lines = []
+    for name, values in zip(names, columns):
+        error = set_variable(name, as_column(values), global_vars)
+        lines.append(error or f"{name}  :  {len(values)} values")
+    return lines
+
+#Commands are lines that start with a colon and a name. They control the calculator instead of computing something.
+#Each one is called with global_vars and the rest of the line, and returns the text to display.
+COMMANDS = {
+    "profile" : profile_command,
+    "load" : load_command,
+}
+
+def run_command(line, global_vars):
+    """Runs a command line like :profile on"""
+    name, _, argument = line[1:].partition(" ")
+    command = COMMANDS.get(name)
+    if command is None:
+        return f"Error: \"{name}\" is not a command. The commands are {', '.join(':' + name for name in COMMANDS)}."
+    return command(global_vars, argument.strip())
+
+def stop_line(signal_number, frame):
+    #A tick can arrive after the budget's with block ended, while the timer is being turned off or just after,
+    #   and the line must not be stopped in the middle of an Uninterrupted update. Later ticks stop it after the update.
+    if not TimeBudget.armed or Uninterrupted.depth or frame.f_code is TimeBudget.__exit__.__code__:
+        return
+    raise LimitExceeded(f"Error: The line took longer than {time_limit} seconds, so it was stopped.")
+
+class Uninterrupted():
+    """Defers stopping a line until the with block ends,
+        for updates that would be left inconsistent if they were stopped halfway"""
+    depth = 0
+
+    def __enter__(self):
+        Uninterrupted.depth += 1
+        return self
+
+    def __exit__(self, *exception):
+        Uninterrupted.depth -= 1
+
+class TimeBudget():
+    """Limits the time spent evaluating a line to seconds. Only the time spent inside the with block counts,
+        so a line whose output is streamed isn't charged for waiting on its reader.
+        When the budget runs out, LimitExceeded is raised in the middle of whatever the line is doing, and again every
+        INTERVAL seconds in case something catches it. Work inside a single call of a C function, like a huge
+        multiplication, can't be stopped, which is why check_digits refuses it up front.
+        Interval timers only exist on Unix and only work in the main thread. Anywhere else, nothing is limited."""
+
+    INTERVAL = 0.05
+    installed = None
+    armed = False #Whether a with block is running, so that ticks that arrive after it ends are ignored
+
+    def __init__(self, seconds):
+        import time
+        self.clock = time.perf_counter
+        self.remaining = seconds if seconds is not None and TimeBudget.install() else None
+
+    @staticmethod
+    def install():
+        """Installs the SIGALRM handler the first time a budget is made, and returns whether budgets can be enforced"""
+        if TimeBudget.installed is None:
+            import signal
+            try:
+                signal.signal(signal.SIGALRM, stop_line)
+                TimeBudget.installed = True
+            except (AttributeError, ValueError):
+                TimeBudget.installed = False
+        return TimeBudget.installed
+
+    def __enter__(self):
+        if self.remaining is not None:
+            import signal
+            self.start = self.clock()
+            TimeBudget.armed = True
+            signal.setitimer(signal.ITIMER_REAL, max(self.remaining, 0.001), TimeBudget.INTERVAL)
+        return self
+
+    def __exit__(self, *exception):
+        TimeBudget.armed = False
+        if self.remaining is not None:
+            import signal
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            self.remaining -= self.clock() - self.start
+
+def evaluate_limited(line, global_vars, cache=expression_cache):
+    """Like evaluate, but yields the display text a line at a time and keeps the line within its budgets.
+        A line that runs out of time or memory is stopped and its error is yielded instead,
+        which leaves the calculator ready for the next line."""
+    global call_depth
+    budget = TimeBudget(time_limit)
+    try:
+        with budget:
+            output = evaluate(line, global_vars, cache)
+        if type(output) == str:
+            yield output
+            return
+
+        output = iter(output)
+        while True:
+            with budget:
+                text = next(output, None)
+            if text is None:
+                return
+            yield text
+    except CalculatorError as error:
+        call_depth = 0 #The line may have been stopped inside a user function
+        yield str(error)
+    except MemoryError:
+        call_depth = 0
+        yield "Error: The line ran out of memory."
+    except KeyboardInterrupt:
+        call_depth = 0
+        raise
+
+def read_lines(stream):
+    """Lazily yields the non-blank lines of a stream without their line endings"""
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if line.strip() != "":
+            yield line
+
+def evaluate_lines(lines, global_vars, cache=expression_cache):
+    """Lazily evaluates each line against a shared global_vars and yields its display text"""
+    for line in lines:
+        yield evaluate(line, global_vars, cache) if time_limit is None else evaluate_limited(line, global_vars, cache)
+
+def write_output(output, write):
+    """Writes the display text of a line, or each of its lines if it is a lazy iterable"""
+    if type(output) == str:
+        write(output)
+        write("\n")
+    else:
+        for line in output:
+            write(line)
+            write("\n")
+
+def run_batch(stream, out, global_vars):
+    """Streams expressions from stream through the evaluator and writes the results to out.
+        Memory use does not depend on the size of the input."""
+    write = out.write
+    for output in evaluate_lines(read_lines(stream), global_vars):
+        write_output(output, write)
+
+class Store():
+    """An on-disk store that carries variables, compiled programs and the prompt history across sessions.
+        Variables and programs are pickled into separate files so that the programs,
+        which are only needed once a line misses the expression cache, are loaded lazily.
+        Formulas and user functions are saved with the variables."""
+
+    VERSION = 3
+
+    def __init__(self, directory):
+        self.directory = os.path.expanduser(directory)
+        self.variables_path = os.path.join(self.directory, "variables.pickle")
+        self.programs_path = os.path.join(self.directory, "programs.pickle")
+        self.history_path = os.path.join(self.directory, "history")
+
+    def read(self, path):
+        """Returns the data saved at path, or None if there is nothing valid there"""
+        import pickle
+
+        try:
+            with open(path, "rb") as file:
+                version, data = pickle.load(file)
+        except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        if version != Store.VERSION:
+            return None
+        return data
+
+    def write(self, path, data):
+        """Atomically replaces the data saved at path"""
+        import pickle
+
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            pickle.dump((Store.VERSION, data), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+    def load_variables(self, global_vars):
+        """Restores the saved variables, including @, and formulas into global_vars"""
+        saved = self.read(self.variables_path)
+        if saved is None:
+            return
+        variables, backend_name, formulas, functions = saved
+        for name, value in variables.items():
+            if name not in CONSTANTS:
+                global_vars[name] = value if backend_name == numeric_backend.name else convert_number(value, numeric_backend)
+
+        def convert(postfix):
+            return postfix if backend_name == numeric_backend.name else convert_literals(postfix, numeric_backend.convert)
+
+        #Functions first, since formulas may call them
+        if hasattr(global_vars, "functions"):
+            for name, (parameters, postfix) in functions.items():
+                try:
+                    define(global_vars, Program([name]), Program(list(parameters)), Program(convert(postfix)))
+                except CalculatorError:
+                    pass
+
+        if hasattr(global_vars, "formulas"):
+            for name, postfix in formulas.items():
+                try:
+                    global_vars.formulas.bind(name, Program(convert(postfix)), global_vars)
+                except CalculatorError:
+                    pass
+
+    def save_variables(self, global_vars):
+        """Saves every variable that isn't a constant and can be pickled"""
+        import pickle
+
+        variables = {}
+        for name, value in global_vars.items():
+            if name in CONSTANTS:
                 continue
+            try:
+                pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                continue
+            variables[name] = value
+
+        formulas = getattr(global_vars, "formulas", None)
+        programs = {} if formulas is None else {name : program.postfix for name, program in formulas.programs.items()}
+        functions = {name : (function.parameters, get_postfix(function.body)) for name, function in getattr(global_vars, "functions", {}).items()}
+        self.write(self.variables_path, (variables, numeric_backend.name, programs, functions))
+
+    @staticmethod
+    def program_options():
+        """The options that change how programs are compiled. Programs saved with other options aren't loaded,
+            since their literals have another type or their constants were folded differently."""
+        return (numeric_backend.name, approximate_combinatorics)
+
+    def load_programs(self):
+        """Returns the saved (line, postfix) pairs, oldest first, if they were compiled with the current options"""
+        saved = self.read(self.programs_path)
+        if saved is None:
+            return []
+        options, entries = saved
+        if options != Store.program_options():
+            return []
+        return entries
+
+    def save_programs(self, cache):
+        """Saves the postfix form of every program in the cache, oldest first"""
+        entries = [(line, get_postfix(program)) for line, program in cache.programs.items()]
+        self.write(self.programs_path, (Store.program_options(), entries))
+
+    def attach(self, global_vars, cache):
+        """Loads the variables now, loads the programs into cache on its first miss,
+            and saves both when the calculator exits"""
+        self.load_variables(global_vars)
+        cache.loader = self.load_programs
+        atexit.register(self.save, global_vars, cache)
+
+    def save(self, global_vars, cache):
+        self.save_variables(global_vars)
+        if cache.loader is None: #Otherwise the saved programs were never loaded and are still current
+            self.save_programs(cache)
+
+#Lines that change variables, read the last answer, exit or make tables can't be evaluated out of order, so they are evaluated
+#in the main process once every line before them is done. Every other line only reads variables.
+#A line that starts with an infix operator reads the last answer without naming it.
+ASSIGNMENT_SYMBOLS = frozenset(op[0] for op in ASSIGNMENT_OPERATORS)
+BARRIER_NAMES = frozenset(["@", "exit", "table"]) #Tables stream their rows, which a worker would have to collect first
+BARRIER_TEXT = ASSIGNMENT_SYMBOLS | BARRIER_NAMES
+INFIX_FIRST_CHARACTERS = frozenset(symbol[0] for symbol in OPERATOR_POSITIONS[0]) #Lines starting with these may read @
+PARALLEL_CHUNK_SIZE = 256 #Lines sent to a worker at once
+
+def is_barrier(line):
+    """Returns whether line has to be evaluated after every line before it, judging by its tokens"""
+    if line[:1] == ":":
+        return True #Commands
+    if line.lstrip()[:1] not in INFIX_FIRST_CHARACTERS and not any(text in line for text in BARRIER_TEXT):
+        return False #Most lines can be ruled out without tokenizing them
+    tokens = tokenize(line)
+    if type(tokens) == str:
+        return False
+    if reads_last_answer(tokens):
+        return True
+    return any(type(token) == str and (token in ASSIGNMENT_SYMBOLS or token in BARRIER_NAMES) for token in tokens)
+
+def initialize_worker(backend_name, approximate, compile_to_python, limits):
+    """Gives a worker process the numeric backend and options of the main process"""
+    global approximate_combinatorics, max_digits, memory_limit, time_limit
+    approximate_combinatorics = approximate
+    max_digits, memory_limit, time_limit = limits
+    if backend_name != numeric_backend.name:
+        set_backend(get_backend(backend_name), {})
+    if compile_to_python:
+        expression_cache.compiler = compile_line_to_python
+
+def evaluate_chunk(task):
+    """Evaluates a chunk of lines in a worker against a snapshot of the variables.
+        Returns the output of each line, with tables already expanded into their rows,
+        and whether and how the line changed @."""
+    scope, lines = task
+    results = []
+    for line in lines:
+        scope.pop("@", None) #No line here reads @, so it's only there if this line set it
+        output = evaluate(line, scope) if time_limit is None else evaluate_limited(line, scope)
+        if type(output) != str:
+            output = list(output)
+        results.append((output, "@" in scope, scope.get("@")))
+    return results
+
+def evaluate_segment(lines, global_vars, pool, chunk_size):
+    """Evaluates lines that don't depend on each other across the pool and yields their output in order"""
+    snapshot = Scope(global_vars) #Without its formulas, since no line here assigns
+    snapshot.functions = getattr(global_vars, "functions", {})
+    chunks = [(snapshot, lines[i:i + chunk_size]) for i in range(0, len(lines), chunk_size)]
+    for results in pool.imap(evaluate_chunk, chunks):
+        for output, changed, answer in results:
+            if changed:
+                set_variable("@", answer, global_vars)
+            yield output
+
+def evaluate_lines_parallel(lines, global_vars, pool, jobs, chunk_size=PARALLEL_CHUNK_SIZE):
+    """Like evaluate_lines, but evaluates the lines between barriers in the worker processes of pool.
+        At most a few chunks per worker are read ahead, so memory use does not depend on the size of the input."""
+    segment = []
+    for line in lines:
+        if is_barrier(line):
+            yield from evaluate_segment(segment, global_vars, pool, chunk_size)
+            segment = []
+            yield evaluate(line, global_vars) if time_limit is None else evaluate_limited(line, global_vars)
+        else:
+            segment.append(line)
+            if len(segment) >= chunk_size * jobs * 4:
+                yield from evaluate_segment(segment, global_vars, pool, chunk_size)
+                segment = []
+    yield from evaluate_segment(segment, global_vars, pool, chunk_size)
+
+def run_parallel_batch(stream, out, global_vars, jobs):
+    """Like run_batch, but spreads the lines that don't depend on each other over jobs processes"""
+    import multiprocessing
+
+    write = out.write
+    options = (numeric_backend.name, approximate_combinatorics, expression_cache.compiler is compile_line_to_python,
+               (max_digits, memory_limit, time_limit))
+    with multiprocessing.Pool(jobs, initializer=initialize_worker, initargs=options) as pool:
+        for output in evaluate_lines_parallel(read_lines(stream), global_vars, pool, jobs):
+            write_output(output, write)
+
+DEFAULT_SOCKET = "~/.clc/socket"
+RESPONSE_END = "\x04" #Ends each response of the server, followed by the microseconds the server spent on the request
+
+async def serve_client(reader, writer, scope):
+    """Answers each line a client sends with its display text, then RESPONSE_END and the request's latency"""
+    import time
+
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            start = time.perf_counter()
+            line = line.decode().rstrip("\r\n")
+            if line.strip() != "":
+                #Table rows are sent as they are computed so that other clients are answered in between
+                for text in evaluate_limited(line, scope):
+                    writer.write(text.encode() + b"\n")
+                    await writer.drain()
+            writer.write(f"{RESPONSE_END}{(time.perf_counter() - start) * 1e6:.0f}\n".encode())
+            await writer.drain()
+    except ConnectionError:
+        pass
+    except SystemExit:
+        pass #exit() ends the session of the client that sent it, not the server
+    finally:
+        writer.close()
+
+def run_server(path, global_vars, shared=False):
+    """Keeps the calculator resident and answers lines sent over a Unix domain socket at path.
+        Every client gets its own copy of global_vars unless shared is set.
+        The compiled expression cache is always shared."""
+    import asyncio, stat, signal
+
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.remove(path) #Left behind by a server that didn't exit cleanly
+
+    async def handle_client(reader, writer):
+        await serve_client(reader, writer, global_vars if shared else global_vars.copy())
+
+    async def serve():
+        server = await asyncio.start_unix_server(handle_client, path)
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        async with server:
+            await stop.wait()
+
+    print(f"Serving calculator on {path}")
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def run_interactive(global_vars, store=None):
+    import readline
+
+    if store is not None:
+        try:
+            readline.read_history_file(store.history_path)
+        except OSError:
+            pass
+        os.makedirs(store.directory, exist_ok=True)
+        atexit.register(readline.write_history_file, store.history_path)
+
+    print("Welcome to calculator.")
+    last_line = ""
+    while True:
+        try:
+            line = input("\n>> ")
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        
+        if line == "":
+            line = last_line
         else:
-            print(result)
+            last_line = line
+
+        try:
+            write_output(evaluate_limited(line, global_vars), sys.stdout.write)
+        except KeyboardInterrupt:
+            print("\nError: The line was interrupted.")
+
+def parse_arguments(argv):
+    """Returns the command line options. Without any arguments, argparse isn't imported, which starts the prompt sooner."""
+    store = os.environ.get("CLC_STORE")
+    if not argv:
+        return types.SimpleNamespace(file=None, python=False, decimal=None, fraction=False, approximate=False, store=store,
+                                     serve=None, shared=False, jobs=1, profile=False, timeout=None, max_digits=None, max_memory=None)
+
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="A shell-interface for a calculator")
+    arg_parser.add_argument("file", nargs="?", help="evaluate the expressions in this file (- for stdin) instead of starting the interactive prompt")
+    arg_parser.add_argument("--python", action="store_true", help="compile expressions into Python functions instead of interpreting their postfix programs")
+    backend_group = arg_parser.add_mutually_exclusive_group()
+    backend_group.add_argument("--decimal", type=int, metavar="PRECISION", help="compute with decimal numbers of PRECISION significant digits")
+    backend_group.add_argument("--fraction", action="store_true", help="compute with exact fractions")
+    arg_parser.add_argument("--approximate", action="store_true", help="estimate factorials, perm and chose with log-gamma instead of computing them exactly")
+    arg_parser.add_argument("--store", nargs="?", const="~/.clc", default=store, metavar="DIRECTORY",
+                            help="keep variables, compiled expressions and history in DIRECTORY (default ~/.clc) between sessions")
+    arg_parser.add_argument("--profile", action="store_true", help="time each stage of every line and print a report to stderr at exit")
+    arg_parser.add_argument("--jobs", type=int, default=1, metavar="N", help="evaluate a file with N processes")
+    arg_parser.add_argument("--serve", nargs="?", const=DEFAULT_SOCKET, metavar="SOCKET",
+                            help=f"stay resident and answer CLC_client.py over the Unix socket SOCKET (default {DEFAULT_SOCKET})")
+    arg_parser.add_argument("--shared", action="store_true", help="with --serve, let every client use the same variables")
+    arg_parser.add_argument("--timeout", type=float, metavar="SECONDS",
+                            help=f"stop any line that runs longer than SECONDS, 0 for no limit (default {TIME_LIMIT} at the prompt and with --serve, otherwise no limit)")
+    arg_parser.add_argument("--max-digits", type=int, metavar="DIGITS",
+                            help=f"refuse exact results estimated to have more than DIGITS digits, 0 for no limit (default {max_digits})")
+    arg_parser.add_argument("--max-memory", type=int, metavar="MB",
+                            help=f"refuse arrays estimated to need more than MB megabytes, 0 for no limit (default {memory_limit // 2**20})")
+    return arg_parser.parse_args(argv)
 
-        set_variable("@", result, global_vars) #update the answer variable
+if __name__ == "__main__":
+    args = parse_arguments(sys.argv[1:])
+
+    approximate_combinatorics = args.approximate
+    if args.timeout is not None:
+        time_limit = args.timeout or None
+    elif args.serve is not None or args.file is None:
+        time_limit = TIME_LIMIT
+    if args.max_digits is not None:
+        max_digits = args.max_digits or None
+    if args.max_memory is not None:
+        memory_limit = args.max_memory * 2**20 or None
+
+    if args.decimal is not None:
+        set_backend(make_decimal_backend(args.decimal), global_vars)
+    elif args.fraction:
+        set_backend(make_fraction_backend(), global_vars)
+
+    if args.python:
+        expression_cache.compiler = compile_line_to_python
+
+    if args.profile:
+        profiler = Profiler()
+        atexit.register(lambda: profiler is not None and sys.stderr.write("\n".join(profiler.report()) + "\n"))
+
+    store = None
+    if args.store is not None:
+        store = Store(args.store)
+        store.attach(global_vars, expression_cache)
+
+    if args.serve is not None:
+        run_server(args.serve, global_vars, args.shared)
+    elif args.file is None:
+        run_interactive(global_vars, store)
+    elif args.jobs > 1:
+        with (sys.stdin if args.file == "-" else open(args.file)) as stream:
+            run_parallel_batch(stream, sys.stdout, global_vars, args.jobs)
+    elif args.file == "-":
+        run_batch(sys.stdin, sys.stdout, global_vars)
+    else:
+        with open(args.file) as stream:
+            run_batch(stream, sys.stdout, global_vars)
@@ -0,0 +1,72 @@
+# Command  Line Calculator client
+#
+# Sends lines to a calculator started with `python CLC.py --serve` and prints the results.
+# It only imports what it needs to talk to the socket, so it starts much faster than the calculator itself.
+#
+# Usage: python CLC_client.py [-t] [expression ...]
+# Without expressions, it reads lines like the interactive calculator does.
+# -t also prints the round trip and server time of each line.
+# The socket is ~/.clc/socket unless CLC_SOCKET is set.
+
+import os, socket, sys, time
+
+RESPONSE_END = "\x04" #Must match CLC.RESPONSE_END
+
+def send_line(connection, responses, line):
+    """Sends a line to the server and returns its output lines and the microseconds the server spent on it"""
+    connection.sendall(line.encode() + b"\n")
+    output = []
+    for response in responses:
+        response = response.decode().rstrip("\n")
+        if response.startswith(RESPONSE_END):
+            return output, int(response[len(RESPONSE_END):])
+        output.append(response)
+    raise ConnectionError("the calculator server closed the connection")
+
+def run(connection, lines, show_time, prompt):
+    responses = connection.makefile("rb")
+    last_line = ""
+    for line in lines:
+        if line == "":
+            line = last_line
+        else:
+            last_line = line
+
+        start = time.perf_counter()
+        output, server_time = send_line(connection, responses, line)
+        round_trip = (time.perf_counter() - start) * 1e6
+        for text in output:
+            print(text)
+        if show_time:
+            print(f"({round_trip:.0f} us round trip, {server_time} us in the server)")
+        if prompt:
+            print()
+
+def prompt_lines():
+    while True:
+        try:
+            yield input(">> ")
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    show_time = "-t" in args
+    expressions = [arg for arg in args if arg != "-t"]
+    path = os.path.expanduser(os.environ.get("CLC_SOCKET", "~/.clc/socket"))
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except OSError:
+        sys.exit(f"No calculator is serving on {path}. Start one with: python CLC.py --serve")
+
+    with connection:
+        try:
+            if expressions:
+                run(connection, expressions, show_time, False)
+            else:
+                run(connection, prompt_lines(), show_time, True)
+        except ConnectionError as error:
+            print(f"The session ended: {error}.")
@@ -0,0 +1,703 @@
+# Command  Line Calculator benchmarks
+#
+# Times the stages of the calculator pipeline on generated workloads.
+# Run with: python benchmarks.py
+
+import timeit, time, argparse, math, os, sys, subprocess, tempfile, random, json, platform
+import CLC
+
+def report(name, seconds, runs, units=None, unit_name="ops"):
+    """Prints the time per run and, if given, the throughput in units per second"""
+    line = f"{name:<40} {seconds / runs * 1e6:>12.2f} us/run"
+    if units is not None:
+        line += f" {units * runs / seconds:>14,.0f} {unit_name}/sec"
+    print(line)
+
+def calibrate(function, minimum_seconds):
+    """Returns how many calls of function take at least minimum_seconds, so that short timings aren't swamped by noise"""
+    start = time.process_time()
+    function()
+    seconds = time.process_time() - start
+    return max(1, math.ceil(minimum_seconds / max(seconds, 1e-6)))
+
+def time_it(function, runs):
+    """Returns the best CPU time out of five repeats of calling function runs times"""
+    return min(timeit.repeat(function, number=runs, repeat=5, timer=time.process_time))
+
+def count_operators(postfix):
+    """Returns the number of operator instructions in a postfix program"""
+    return sum(1 for token in postfix if type(token) == tuple)
+
+OPERAND_VARS = {"a" : 1, "b" : 2, "c" : 3, "d" : 4, "f" : 5, "g" : 6, "h" : 7}
+
+def operator_heavy_expression(terms):
+    """Returns an expression with terms operands joined by a mix of binary operators.
+        The operands are the variables in OPERAND_VARS so only operators are measured."""
+    ops = ["+", "*", "-", "/", "^", "%", "==", "<", "&&", ">=", "!="]
+    names = list(OPERAND_VARS)
+    parts = [names[0]]
+    for i in range(1, terms):
+        parts.append(ops[i % len(ops)])
+        parts.append(names[i % len(names)])
+    return " ".join(parts)
+
+def bench_execute_postfix(runs):
+    """Times execute_postfix alone on precompiled operator-heavy programs"""
+    global_vars = dict(CLC.global_vars, **OPERAND_VARS)
+    for terms in [10, 100, 300]:
+        postfix = CLC.compile_line(operator_heavy_expression(terms))
+        seconds = time_it(lambda: CLC.execute_postfix(postfix, global_vars), runs)
+        report(f"execute_postfix operators={count_operators(postfix)}", seconds, runs, count_operators(postfix))
+
+    #The operands are variables so that constant folding doesn't reduce these to a single literal
+    postfix = CLC.compile_line("x = a + b * c")
+    seconds = time_it(lambda: CLC.execute_postfix(postfix, global_vars), runs)
+    report("execute_postfix assignment", seconds, runs, count_operators(postfix))
+
+    postfix = CLC.compile_line("sin(a) + cos(b) * atan2(a, b) - sqrt(c)")
+    seconds = time_it(lambda: CLC.execute_postfix(postfix, global_vars), runs)
+    report("execute_postfix function calls", seconds, runs, count_operators(postfix))
+
+def nested_expression(depth):
+    """Returns an expression nested depth parentheses deep"""
+    return "(" * depth + "1" + " + 1)" * depth
+
+def bench_tokenize(runs):
+    """Times tokenize on long generated lines"""
+    runs = max(1, runs // 100)
+    for terms in [500, 5000, 50000]:
+        line = operator_heavy_expression(terms).replace("b", "12").replace("d", "3.75").replace("g", "sin(h)")
+        seconds = time_it(lambda: CLC.tokenize(line), runs)
+        report(f"tokenize chars={len(line)}", seconds, runs, len(line), "chars")
+
+def bench_parse(runs):
+    """Times parse on flat and deeply nested token lists of growing length.
+        Linear parsing shows up as a constant tokens/sec rate."""
+    runs = max(1, runs // 100)
+    for terms in [500, 5000, 50000]:
+        tokens = CLC.tokenize(operator_heavy_expression(terms))
+        seconds = time_it(lambda: CLC.parse(tokens), runs)
+        report(f"parse flat tokens={len(tokens)}", seconds, runs, len(tokens), "tokens")
+
+    for depth in [100, 1000, 20000]:
+        tokens = CLC.tokenize(nested_expression(depth))
+        seconds = time_it(lambda: CLC.parse(tokens), runs)
+        report(f"parse nested tokens={len(tokens)}", seconds, runs, len(tokens), "tokens")
+
+    for arguments in [100, 1000, 10000]:
+        tokens = CLC.tokenize("f(" + ", ".join(f"x + {i}" for i in range(arguments)) + ")")
+        seconds = time_it(lambda: CLC.to_postfix(CLC.parse(tokens)), runs)
+        report(f"parse call arguments={arguments}", seconds, runs, len(tokens), "tokens")
+
+def bench_fold(runs):
+    """Compares executing programs with and without constant folding"""
+    global_vars = dict(CLC.global_vars, r=2, x=3)
+    for line in ["2*pi*r", "rad(45)*x", "sqrt(2)/2 * sin(pi/4) + x * (1 + 1/3)^2"]:
+        tokens = CLC.parse(CLC.tokenize(line))
+        unfolded = CLC.compile_special_forms(CLC.to_postfix(tokens))
+        folded = CLC.fold_constants(unfolded)
+        for name, postfix in [("unfolded", unfolded), ("folded", folded)]:
+            seconds = time_it(lambda: CLC.execute_postfix(postfix, global_vars), runs * 10)
+            report(f"{name} {line}", seconds, runs * 10)
+
+def bench_python(runs):
+    """Compares the postfix interpreter with programs compiled into Python functions"""
+    global_vars = dict(CLC.global_vars, **OPERAND_VARS)
+    lines = [operator_heavy_expression(10), operator_heavy_expression(100),
+             "x = a * b + sin(c) ^ 2", "atan2(a, b) + sqrt(c) * logbase(d, 2)"]
+    for line in lines:
+        postfix = CLC.compile_line(line)
+        function = CLC.compile_to_python(postfix)
+        interpreted = time_it(lambda: CLC.execute_postfix(postfix, global_vars), runs * 10)
+        compiled = time_it(lambda: function(global_vars), runs * 10)
+        name = line if len(line) < 30 else f"operators={count_operators(postfix)}"
+        report(f"postfix {name}", interpreted, runs * 10, count_operators(postfix))
+        report(f"python {name}", compiled, runs * 10, count_operators(postfix))
+
+def arithmetic_chain(terms):
+    """Returns a long chain of additions, subtractions, multiplications and divisions of small literals"""
+    ops = ["+", "*", "-", "/"]
+    parts = ["1"]
+    for i in range(1, terms):
+        parts.append(ops[i % len(ops)])
+        parts.append(str(i % 9 + 1))
+    return " ".join(parts)
+
+def bench_backends(runs):
+    """Times a long arithmetic chain on each numeric backend"""
+    global_vars = dict(CLC.global_vars)
+    line = arithmetic_chain(200)
+    backends = [("float", CLC.FLOAT_BACKEND), ("decimal(15)", CLC.make_decimal_backend(15)),
+                ("decimal(50)", CLC.make_decimal_backend(50)), ("decimal(500)", CLC.make_decimal_backend(500)),
+                ("fraction", CLC.make_fraction_backend())]
+    try:
+        for name, backend in backends:
+            CLC.set_backend(backend, global_vars)
+            #Compiled without constant folding so that the whole chain is executed
+            tokens = CLC.parse(CLC.tokenize(line))
+            postfix = CLC.convert_literals(CLC.to_postfix(tokens), backend.convert)
+            seconds = time_it(lambda: CLC.execute_postfix(postfix, global_vars), runs)
+            report(f"backend {name} operators={count_operators(postfix)}", seconds, runs, count_operators(postfix))
+    finally:
+        CLC.set_backend(CLC.FLOAT_BACKEND, global_vars)
+
+def factorial_chose(n, r):
+    """The full-factorial binomial coefficient CLC used to compute, for comparison"""
+    return math.factorial(n) // (math.factorial(n-r) * math.factorial(r))
+
+def bench_combinatorics(runs):
+    """Times chose, perm and factorials for n from 10 to 10^6, exactly and approximately"""
+    runs = max(1, runs // 100)
+    for n in [10, 1000, 10**5, 10**6]:
+        if n <= 10**5:
+            seconds = time_it(lambda: factorial_chose(n, 3), runs)
+            report(f"factorial chose({n}, 3)", seconds, runs)
+        seconds = time_it(lambda: CLC.Chose(n, 3), runs)
+        report(f"chose({n}, 3)", seconds, runs)
+        seconds = time_it(lambda: CLC.Perm(n, 3), runs)
+        report(f"perm({n}, 3)", seconds, runs)
+        if n <= 10**5:
+            seconds = time_it(lambda: CLC.Chose(n, n // 2), runs)
+            report(f"chose({n}, {n // 2})", seconds, runs)
+        #10^6! takes seconds to compute exactly, which is what approximate mode is for
+        if n <= 10**5:
+            CLC.exact_factorial.cache_clear()
+            start = time.process_time()
+            CLC.factorial(n)
+            report(f"{n}! first", time.process_time() - start, 1)
+            seconds = time_it(lambda: CLC.factorial(n), runs)
+            report(f"{n}! memoized", seconds, runs)
+
+    CLC.approximate_combinatorics = True
+    try:
+        for n in [10, 10**6, 10**12]:
+            seconds = time_it(lambda: CLC.Chose(n, n // 2), runs * 100)
+            report(f"approximate chose({n}, {n // 2})", seconds, runs * 100)
+            seconds = time_it(lambda: CLC.factorial(n), runs * 100)
+            report(f"approximate {n}!", seconds, runs * 100)
+    finally:
+        CLC.approximate_combinatorics = False
+
+def bench_table(runs):
+    """Times streaming the rows of a table() sweep, which compiles its body once"""
+    global_vars = dict(CLC.global_vars)
+    steps = 10**4
+    line = f"table(x, 0, 10, {10 / steps}, x^2 - 3*x)"
+    runs = max(1, runs // 100)
+    seconds = time_it(lambda: sum(1 for row in CLC.evaluate(line, global_vars)), runs)
+    report(f"table rows={steps + 1}", seconds, runs, steps + 1, "rows")
+
+def bench_vectorized(runs):
+    """Compares a scalar loop over execute_postfix with one vectorized execution over a NumPy array"""
+    try:
+        numpy = CLC.get_numpy()
+    except CLC.CalculatorError as error:
+        print(f"vectorized: skipped ({error})")
+        return
+
+    line = "sin(x)^2 + cos(x)"
+    postfix = CLC.compile_line(line)
+    global_vars = dict(CLC.global_vars)
+    values = numpy.linspace(0, 10, 10**6)
+
+    def scalar_loop():
+        for value in values[:10**4].tolist():
+            global_vars["x"] = value
+            CLC.execute_postfix(postfix, global_vars)
+
+    runs = max(1, runs // 100)
+    seconds = time_it(scalar_loop, runs)
+    report(f"scalar {line} n=10^4", seconds, runs, 10**4, "values")
+    seconds = time_it(lambda: CLC.evaluate_over(line, {"x" : values}, global_vars), runs)
+    report(f"vectorized {line} n=10^6", seconds, runs, 10**6, "values")
+
+STARTUP_BUDGET_MS = 50 #Time to the first result of a new calculator, which is how it is used from a keyboard shortcut
+
+def time_to_exit(command, env):
+    """Returns the seconds a command takes to run to completion"""
+    start = time.perf_counter()
+    subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, env=env)
+    return time.perf_counter() - start
+
+def time_startup(command, env):
+    """Starts the interactive calculator and returns the seconds to its first prompt and to the result of its first line"""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env, text=True)
+    process.stdout.readline() #The welcome message, printed right before the first prompt
+    first_prompt = time.perf_counter() - start
+    process.stdin.write("1+1\n")
+    process.stdin.flush()
+    while process.stdout.readline().strip() != ">> 2":
+        pass
+    first_result = time.perf_counter() - start
+    process.stdin.close()
+    process.wait()
+    return first_prompt, first_result
+
+def top_level_imports(command, env):
+    """Returns (cumulative microseconds, module) for each top level import, found with python -X importtime, slowest first"""
+    output = subprocess.run(command[:1] + ["-X", "importtime"] + command[1:], input="", capture_output=True, env=env, text=True).stderr
+    imports = []
+    for line in output.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit() and not name.startswith("  "):
+                imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)
+
+def bench_startup(runs):
+    """Times a new interactive calculator to its first prompt and first result.
+        Running CLC.py as a script compiles its source every time, while python -m CLC can use cached bytecode."""
+    runs = max(1, runs // 40)
+    directory = os.path.dirname(os.path.abspath(CLC.__file__))
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env.pop("CLC_STORE", None)
+
+    with tempfile.TemporaryDirectory() as cache_directory:
+        cached_env = dict(env, PYTHONPYCACHEPREFIX=cache_directory, PYTHONPATH=directory)
+        commands = {
+            "script" : ([sys.executable, os.path.join(directory, "CLC.py")], env),
+            "python -m CLC" : ([sys.executable, "-m", "CLC"], cached_env),
+        }
+        subprocess.run(commands["python -m CLC"][0], input="1+1\n", capture_output=True, env=cached_env, text=True) #Writes the cached bytecode
+
+        interpreter = min(time_to_exit([sys.executable, "-c", "pass"], env) for _ in range(runs))
+        print(f"{'python -c pass':<40} {interpreter * 1e3:>12.2f} ms")
+
+        for name, (command, command_env) in commands.items():
+            first_prompt, first_result = min(time_startup(command, command_env) for _ in range(runs))
+            verdict = "within" if first_result * 1e3 <= STARTUP_BUDGET_MS else "over"
+            print(f"{name + ' first prompt':<40} {first_prompt * 1e3:>12.2f} ms")
+            print(f"{name + ' first result':<40} {first_result * 1e3:>12.2f} ms ({verdict} the {STARTUP_BUDGET_MS} ms budget)")
+
+        for microseconds, module in top_level_imports(*commands["python -m CLC"])[:5]:
+            print(f"{'  import ' + module:<40} {microseconds / 1e3:>12.2f} ms")
+
+def bench_daemon(runs):
+    """Times requests to a resident calculator server: the latency of each line sent over one connection,
+        several clients at once, and launching CLC_client.py for a single line"""
+    import socket, threading, statistics
+    import CLC_client
+
+    directory = os.path.dirname(os.path.abspath(CLC.__file__))
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    env.pop("CLC_STORE", None)
+
+    with tempfile.TemporaryDirectory() as socket_directory:
+        path = os.path.join(socket_directory, "socket")
+        server = subprocess.Popen([sys.executable, os.path.join(directory, "CLC.py"), "--serve", path], stdout=subprocess.PIPE, env=env, text=True)
+        try:
+            server.stdout.readline() #Printed just before the server starts listening
+            while not os.path.exists(path):
+                time.sleep(0.01)
+
+            def request_latencies(lines):
+                """Sends each line over a new connection and returns the round trip microseconds of each"""
+                latencies = []
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                    connection.connect(path)
+                    responses = connection.makefile("rb")
+                    for line in lines:
+                        start = time.perf_counter()
+                        CLC_client.send_line(connection, responses, line)
+                        latencies.append((time.perf_counter() - start) * 1e6)
+                return latencies
+
+            for line in ["1+1", "sin(x) * 2 + x^2", "x = x + 1", "20!"]:
+                request_latencies(["x = 1"])
+                latencies = sorted(request_latencies([line] * runs * 5))
+                print(f"{'request ' + repr(line):<40} {statistics.median(latencies):>12.2f} us median {latencies[len(latencies) * 99 // 100]:>10.2f} us p99")
+
+            for clients in [1, 4, 16]:
+                results = []
+                threads = [threading.Thread(target=lambda: results.extend(request_latencies(["2 * 3 + 1"] * runs))) for _ in range(clients)]
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                seconds = time.perf_counter() - start
+                results.sort()
+                print(f"{f'{clients} concurrent clients':<40} {statistics.median(results):>12.2f} us median {len(results) / seconds:>14,.0f} requests/sec")
+
+            client_env = dict(env, CLC_SOCKET=path)
+            seconds = min(time_to_exit([sys.executable, os.path.join(directory, "CLC_client.py"), "1+1"], client_env) for _ in range(max(1, runs // 40)))
+            print(f"{'CLC_client.py first result':<40} {seconds * 1e3:>12.2f} ms")
+        finally:
+            server.terminate()
+            server.wait()
+
+def independent_lines(count):
+    """Returns count distinct function-heavy lines, with an assignment every 100 lines as a barrier"""
+    lines = []
+    for i in range(count):
+        if i % 100 == 99:
+            lines.append(f"v = {i}")
+        else:
+            lines.append(f"sin({i}) * cos(v) + sqrt({i}) ^ 2 + atan2({i % 5}, 3) + {i % 20}!")
+    return lines
+
+def bench_parallel(runs):
+    """Compares batch evaluation in one process with the process pool, from 1 to N worker processes.
+        Times are wall clock, since the work happens in other processes."""
+    import io
+
+    text = "v = 1\n" + "\n".join(independent_lines(max(1000, runs * 20))) + "\n"
+    line_count = text.count("\n")
+
+    def run(jobs):
+        CLC.expression_cache.clear() #Every line is compiled, like in a new calculator
+        out = io.StringIO()
+        start = time.perf_counter()
+        if jobs == 0:
+            CLC.run_batch(io.StringIO(text), out, dict(CLC.global_vars))
+        else:
+            CLC.run_parallel_batch(io.StringIO(text), out, dict(CLC.global_vars), jobs)
+        return time.perf_counter() - start
+
+    sequential = min(run(0) for _ in range(3))
+    report(f"run_batch lines={line_count}", sequential, 1, line_count, "lines")
+    for jobs in sorted(set([1, 2, 4, os.cpu_count() or 1])):
+        seconds = min(run(jobs) for _ in range(3))
+        report(f"run_parallel_batch jobs={jobs}", seconds, 1, line_count, "lines")
+        print(f"{'  speedup':<40} {sequential / seconds:>12.2f} x ({os.cpu_count()} cpus)")
+
+def bench_formulas(runs):
+    """Times changing an input of N formulas bound with :=. In a chain every formula depends on the last,
+        so all N are recomputed, while in a wide set only the one formula that reads the input is."""
+    for count in [100, 1000, 10000]:
+        chain = CLC.Scope(CLC.global_vars)
+        CLC.evaluate("f0 := x + 1", chain)
+        for i in range(1, count):
+            CLC.evaluate(f"f{i} := f{i - 1} * 0.5 + x", chain)
+        seconds = time_it(lambda: CLC.set_variable("x", time.perf_counter(), chain), max(1, runs // 20))
+        report(f"chain of {count} formulas", seconds, max(1, runs // 20), count, "formulas")
+
+        wide = CLC.Scope(CLC.global_vars)
+        for i in range(count):
+            CLC.evaluate(f"x{i} = {i}", wide)
+            CLC.evaluate(f"w{i} := x{i} * 2 + 1", wide)
+        seconds = time_it(lambda: CLC.set_variable("x0", time.perf_counter(), wide), runs)
+        report(f"one input of {count} formulas", seconds, runs, 1, "formulas")
+
+def bench_user_functions(runs):
+    """Compares calling a built-in function with calling user functions defined in the calculator.
+        The pure user function is memoized, so it is timed both with new and with repeated arguments."""
+    for compiler in [CLC.compile_line, CLC.compile_line_to_python]:
+        CLC.expression_cache.compiler = compiler
+        backend = "python" if compiler is CLC.compile_line_to_python else "postfix"
+        scope = CLC.Scope(CLC.global_vars)
+        for line in ["x = 2", "k = 3", "sq(y) = sqrt(y)", "shifted(y) = sqrt(y) + k", "twice(y) = sq(y) + sq(y)"]:
+            CLC.evaluate(line, scope)
+
+        for name, line in [("built-in", "sqrt(x)"), ("pure user, memoized", "sq(x)"),
+                           ("user reading a variable", "shifted(x)"), ("user calling user", "twice(x)")]:
+            program = compiler(line)
+            seconds = time_it(lambda: CLC.execute_program(program, scope), runs * 10)
+            report(f"{backend} {name}", seconds, runs * 10)
+
+        program = compiler("sq(x)")
+        def new_arguments():
+            scope["x"] += 1
+            CLC.execute_program(program, scope)
+        seconds = time_it(new_arguments, runs * 10)
+        report(f"{backend} pure user, new arguments", seconds, runs * 10)
+    CLC.expression_cache.compiler = None
+
+def bench_aggregates(runs):
+    """Times the statistics functions on 10^6 values, passed as one list and as a NumPy array through the calculator.
+        The standard library's exact sum and statistics functions are timed on the same list for comparison."""
+    import statistics
+    rng = random.Random(SUITE_SEED)
+    values = [rng.uniform(-1, 1) for i in range(10**6)]
+    runs = max(1, runs // 100)
+    for name in ["sum", "mean", "var", "stdev", "min", "max", "median", "hypot"]:
+        function = CLC.FUNCTIONS[name][1]
+        seconds = time_it(lambda: function(values), runs)
+        report(f"{name} n=10^6", seconds, runs, 10**6, "values")
+
+    for name, function in [("math.fsum", math.fsum), ("statistics.fmean", statistics.fmean),
+                           ("statistics.variance", statistics.variance)]:
+        seconds = time_it(lambda: function(values), runs)
+        report(f"{name} n=10^6", seconds, runs, 10**6, "values")
+
+    try:
+        numpy = CLC.get_numpy()
+    except CLC.CalculatorError as error:
+        print(f"aggregates over arrays: skipped ({error})")
+        return
+    scope = CLC.Scope(CLC.global_vars, x=numpy.array(values))
+    for line in ["sum(x)", "stdev(x)", "max(x, 2)"]:
+        seconds = time_it(lambda: CLC.evaluate(line, scope), runs)
+        report(f"array {line} n=10^6", seconds, runs, 10**6, "values")
+
+def bench_vectors(runs):
+    """Times vector and matrix values from 3 to 10^6 components, against the scalar-argument dot3
+        and, where it is installed, NumPy. Each line runs precompiled, so this is the cost of the operations.
+        Large float dot and matrix products are handed to NumPy, so the 100x100 product is mostly conversion."""
+    scope = CLC.Scope(CLC.global_vars, x=1.5, y=2.5, z=3.5)
+    program = CLC.compile_line("dot3(x, y, z, z, y, x)")
+    seconds = time_it(lambda: CLC.execute_postfix(program, scope), runs * 10)
+    report("scalar dot3 n=3", seconds, runs * 10)
+
+    for exponent in [0, 3, 6]:
+        size = 3 * 10**exponent
+        scope["a"] = CLC.vec(CLC.linspace(0, 1, size) if exponent else (1.5, 2.5, 3.5))
+        scope["b"] = scope["a"] * 2
+        repeats = max(1, runs * 10 // size)
+        for line in ["dot(a, b)", "a + b", "a * 2.5", "(a - b) * (a + b)"]:
+            program = CLC.compile_line(line)
+            seconds = time_it(lambda: CLC.execute_postfix(program, scope), repeats)
+            report(f"vector {line} n={size}", seconds, repeats, size, "components")
+
+    for size in [10, 50, 100]:
+        rows = [CLC.vec(*[float(i * size + j) for j in range(size)]) for i in range(size)]
+        scope["m"] = CLC.matrix(*rows)
+        scope["v"] = rows[0]
+        repeats = max(1, runs * 100 // size**3)
+        for line in ["m * m", "m * v"]:
+            program = CLC.compile_line(line)
+            seconds = time_it(lambda: CLC.execute_postfix(program, scope), repeats)
+            report(f"matrix {line} {size}x{size}", seconds, repeats)
+
+    try:
+        numpy = CLC.get_numpy()
+    except CLC.CalculatorError as error:
+        print(f"vectors with NumPy: skipped ({error})")
+        return
+    a = numpy.linspace(0, 1, 3 * 10**6)
+    b = a * 2
+    repeats = max(1, runs // 100)
+    seconds = time_it(lambda: numpy.dot(a, b), repeats)
+    report(f"numpy dot n={3 * 10**6}", seconds, repeats, 3 * 10**6, "components")
+    m = numpy.arange(100 * 100, dtype=float).reshape(100, 100)
+    seconds = time_it(lambda: m @ m, runs)
+    report("numpy m @ m 100x100", seconds, runs)
+
+def bench_load(runs):
+    """Times :load on 10^6 rows of two columns, memory-mapped from doubles and parsed from CSV,
+        and then an expression over the loaded columns"""
+    from array import array
+    rows = 10**6
+    rng = random.Random(SUITE_SEED)
+    values = array("d", (rng.uniform(-1, 1) for i in range(2 * rows)))
+    with tempfile.TemporaryDirectory() as directory:
+        binary = os.path.join(directory, "data.bin")
+        with open(binary, "wb") as file:
+            values.tofile(file)
+        text = os.path.join(directory, "data.csv")
+        with open(text, "w") as file:
+            file.write("x,y\n")
+            file.writelines(f"{values[i]!r},{values[i + 1]!r}\n" for i in range(0, len(values), 2))
+
+        scope = CLC.Scope(CLC.global_vars)
+        repeats = max(1, runs // 100)
+        for name, line in [("binary", f":load {binary} x y"), ("csv", f":load {text}")]:
+            seconds = time_it(lambda: CLC.evaluate(line, scope), repeats)
+            report(f"load {name} rows=10^6", seconds, repeats, rows, "rows")
+
+        for line in ["mean(x)", "x*x + y*y"]:
+            seconds = time_it(lambda: CLC.evaluate(line, scope), repeats)
+            report(f"{line} over loaded rows=10^6", seconds, repeats, rows, "rows")
+
+def bench_limits(runs):
+    """Times evaluating lines with and without a time budget, and how quickly oversized work is refused"""
+    scope = CLC.Scope(CLC.global_vars, x=2)
+    lines = [f"sin(x) * {i} + x^2" for i in range(100)]
+    repeats = max(1, runs // 10)
+    for limit in [None, 10]:
+        CLC.time_limit = limit
+        seconds = time_it(lambda: [CLC.write_output(output, len) for output in CLC.evaluate_lines(lines, scope)], repeats)
+        report(f"evaluate, time limit {limit}", seconds, repeats * len(lines))
+    CLC.time_limit = None
+
+    for line in ["9999999!", "2^(10^9)", "chose(10^7, 5*10^6)", "linspace(0, 1, 10^10)"]:
+        program = CLC.compile_line(line)
+        seconds = time_it(lambda: CLC.execute_postfix(program, scope), runs)
+        report(f"refuse {line}", seconds, runs)
+
+def bench_profiler(runs):
+    """Times evaluating cached and uncached lines with profiling off and on"""
+    scope = CLC.Scope(CLC.global_vars, x=2)
+    lines = [f"sin(x) * {i} + x^2" for i in range(100)]
+    repeats = max(1, runs // 10)
+    for state in ["off", "on"]:
+        CLC.profile_command(scope, state)
+        for name, cache in [("cached", CLC.ExpressionCache()), ("uncached", CLC.ExpressionCache(maxsize=0))]:
+            seconds = time_it(lambda: [CLC.evaluate(line, scope, cache) for line in lines], repeats)
+            report(f"evaluate {name}, profiling {state}", seconds, repeats * len(lines))
+    CLC.profile_command(scope, "off")
+
+SUITE_SEED = 2020
+SUITE_VARS = dict(OPERAND_VARS, **{f"v{i}" : i + 1 for i in range(10)})
+
+def random_operand(rng):
+    """Returns a variable of SUITE_VARS or a small nonzero literal"""
+    if rng.random() < 0.6:
+        return rng.choice(list(SUITE_VARS))
+    return str(rng.randint(1, 9)) if rng.random() < 0.5 else f"{rng.randint(1, 9)}.{rng.randint(1, 99)}"
+
+def random_call(rng, depth):
+    """Returns a random call of built-in functions nested depth calls deep"""
+    argument = random_operand(rng) if depth == 0 else random_call(rng, depth - 1)
+    kind = rng.randrange(5)
+    if kind == 0:
+        return f"sqrt(abs({argument}))"
+    elif kind == 1:
+        return f"atan2({argument}, {random_operand(rng)})"
+    elif kind == 2:
+        return f"{rng.choice(['sin', 'cos', 'atan', 'abs', 'floor'])}({argument}) + {random_operand(rng)}"
+    elif kind == 3:
+        return f"loge(abs({argument}) + 1)"
+    return f"dot2({argument}, {random_operand(rng)}, {random_operand(rng)}, {random_operand(rng)})"
+
+def generate_cases(seed=SUITE_SEED):
+    """Returns the lines of each case of the suite. They are generated from seed,
+        so every run of the suite measures exactly the same work."""
+    rng = random.Random(seed)
+    operators = ["+", "-", "*", "/"]
+
+    flat = []
+    for _ in range(20):
+        parts = [random_operand(rng)]
+        for _ in range(199):
+            parts += [rng.choice(operators), random_operand(rng)]
+        flat.append(" ".join(parts))
+
+    nested = []
+    for _ in range(20):
+        line = random_operand(rng)
+        for _ in range(rng.randint(50, 100)):
+            line = f"({line} {rng.choice(operators)} {random_operand(rng)})"
+        nested.append(line)
+
+    functions = [random_call(rng, rng.randint(2, 6)) for _ in range(50)]
+
+    assignments = []
+    for _ in range(100):
+        variable = f"v{rng.randrange(10)}"
+        kind = rng.randrange(4)
+        if kind == 0:
+            assignments.append(f"{variable} = {random_operand(rng)} * {random_operand(rng)} + {random_operand(rng)}")
+        elif kind == 1:
+            assignments.append(f"{variable} {rng.choice(['+=', '-='])} {random_operand(rng)}")
+        elif kind == 2:
+            assignments.append(f"{variable}{rng.choice(['++', '--'])}")
+        else:
+            assignments.append(f"{variable} = {f'v{rng.randrange(10)}'} / {rng.randint(1, 9)}")
+
+    #Added to a variable so that they aren't constant folded away
+    factorials = [f"(a - 1 + {rng.randint(500, 5000)})!" for _ in range(10)] + [f"chose(a - 1 + {rng.randint(500, 5000)}, {rng.randint(10, 250)})" for _ in range(10)]
+
+    return {"flat" : flat, "nested" : nested, "functions" : functions, "assignments" : assignments, "factorials" : factorials}
+
+def compile_rest(postfix):
+    """The stages of compile_line after to_postfix"""
+    return CLC.fold_constants(CLC.convert_backend_literals(CLC.compile_forms(postfix)))
+
+def execute_uncached(postfix, scope):
+    """Executes postfix with the factorial cache cleared first,
+        so repeated runs measure the factorials rather than cache hits"""
+    CLC.exact_factorial.cache_clear()
+    return CLC.execute_postfix(postfix, scope)
+
+def bench_suite(runs):
+    """Runs every generated case through each stage of the pipeline separately.
+        Returns the microseconds per line of each stage of each case."""
+    results = {}
+    minimum_seconds = 0.05
+    print(f"{'case':<14}" + "".join(f"{stage:>18}" for stage in ["tokenize", "parse", "to_postfix", "compile_rest", "execute_postfix"]))
+    for case, lines in generate_cases().items():
+        scope = CLC.Scope(CLC.global_vars, **SUITE_VARS)
+        inputs = lines
+        results[case] = {}
+        for stage, function in [("tokenize", CLC.tokenize), ("parse", CLC.parse),
+                                ("to_postfix", CLC.to_postfix), ("compile_rest", compile_rest),
+                                ("execute_postfix", lambda postfix: execute_uncached(postfix, scope))]:
+            outputs = [function(value) for value in inputs]
+            errors = [output for output in outputs if type(output) == str and stage != "execute_postfix"]
+            if errors:
+                raise RuntimeError(f"The {case} case failed in {stage}: {errors[0]}")
+            run_stage = lambda: [function(value) for value in inputs]
+            number = calibrate(run_stage, minimum_seconds * runs / 200)
+            results[case][stage] = time_it(run_stage, number) / number / len(lines) * 1e6
+            inputs = outputs
+        print(f"{case:<14}" + "".join(f"{results[case][stage]:>15.2f} us" for stage in results[case]))
+    return results
+
+def save_baseline(path, results):
+    """Saves suite results as a JSON baseline"""
+    with open(path, "w") as file:
+        json.dump({"seed" : SUITE_SEED, "python" : platform.python_version(), "results" : results}, file, indent=2, sort_keys=True)
+    print(f"Saved the baseline to {path}")
+
+def compare_baseline(path, results, tolerance):
+    """Prints how the suite results compare to a JSON baseline and returns whether any stage got slower than tolerance allows"""
+    with open(path) as file:
+        baseline = json.load(file)
+    if baseline["seed"] != SUITE_SEED:
+        print(f"Warning: the baseline was generated with seed {baseline['seed']}, not {SUITE_SEED}")
+
+    regressed = False
+    print(f"{'case':<14}{'stage':<20}{'baseline us':>14}{'now us':>12}{'ratio':>9}")
+    for case, stages in results.items():
+        for stage, microseconds in stages.items():
+            before = baseline["results"].get(case, {}).get(stage)
+            if before is None:
+                continue
+            ratio = microseconds / before
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "  slower"
+                regressed = True
+            elif ratio < 1 / (1 + tolerance):
+                flag = "  faster"
+            print(f"{case:<14}{stage:<20}{before:>14.2f}{microseconds:>12.2f}{ratio:>9.2f}{flag}")
+    return regressed
+
+BENCHMARKS = {
+    "tokenize" : bench_tokenize,
+    "parse" : bench_parse,
+    "execute" : bench_execute_postfix,
+    "fold" : bench_fold,
+    "python" : bench_python,
+    "backends" : bench_backends,
+    "combinatorics" : bench_combinatorics,
+    "table" : bench_table,
+    "vectorized" : bench_vectorized,
+    "startup" : bench_startup,
+    "daemon" : bench_daemon,
+    "parallel" : bench_parallel,
+    "formulas" : bench_formulas,
+    "functions" : bench_user_functions,
+    "aggregates" : bench_aggregates,
+    "vectors" : bench_vectors,
+    "load" : bench_load,
+    "limits" : bench_limits,
+    "profile" : bench_profiler,
+    "suite" : bench_suite,
+}
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmarks for the calculator pipeline")
+    arg_parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    arg_parser.add_argument("--runs", type=int, default=200, help="number of runs per timing")
+    arg_parser.add_argument("--save", metavar="FILE", help="save the results of the suite as a JSON baseline")
+    arg_parser.add_argument("--compare", metavar="FILE", help="compare the results of the suite with a JSON baseline and fail if a stage got slower")
+    arg_parser.add_argument("--tolerance", type=float, default=0.25, help="how much slower than the baseline a stage may get (default 0.25)")
+    args = arg_parser.parse_args()
+
+    names = args.names or (["suite"] if args.save or args.compare else BENCHMARKS)
+    suite_results = None
+    for name in names:
+        results = BENCHMARKS[name](args.runs)
+        if name == "suite":
+            suite_results = results
+
+    if (args.save or args.compare) and suite_results is None:
+        suite_results = bench_suite(args.runs)
+    if args.save:
+        save_baseline(args.save, suite_results)
+    if args.compare and compare_baseline(args.compare, suite_results, args.tolerance):
+        sys.exit(1)